@@ -0,0 +1,100 @@
+"""
+Concurrency benchmark for the sync and async MongoDB search paths
+
+Fires many concurrent searches from one event loop, the way uvicorn serves
+/search-products, and reports throughput and p50/p99 latency for:
+
+  blocking    sync pymongo called inside the coroutine (the old endpoints)
+  threadpool  sync pymongo via run_in_threadpool
+  async       mongo_async.search_products_page_async
+
+Latency is measured from the moment a search takes one of the concurrency
+slots; with the blocking path the loop runs one search at a time, so
+throughput is the number to compare. The result cache is disabled so every
+search reaches MongoDB. Needs the MONGO_* settings of a reachable cluster.
+
+Usage:
+    python benchmarks/bench_async_search.py [--concurrency 100] [--requests 1000] [--modes blocking,threadpool,async]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.concurrency import run_in_threadpool
+
+from bench_query_parser import SEARCH_CORPUS
+from bench_search_index import percentile
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import mongo_search
+from mongo_async import search_products_page_async, close_async_client
+
+
+def search_blocking(query):
+    async def search():
+        return mongo_search.search_products_page(query)
+    return search()
+
+
+def search_threadpool(query):
+    return run_in_threadpool(mongo_search.search_products_page, query)
+
+
+def search_async(query):
+    return search_products_page_async(query)
+
+
+MODES = {
+    "blocking": search_blocking,
+    "threadpool": search_threadpool,
+    "async": search_async,
+}
+
+
+async def run_mode(search, concurrency, total_requests):
+    queries = [SEARCH_CORPUS[i % len(SEARCH_CORPUS)] for i in range(total_requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            await search(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return total_requests / (time.perf_counter() - started), latencies
+
+
+async def main(concurrency, total_requests, modes):
+    # Every search must reach MongoDB
+    mongo_search.product_search_cache.maxsize = 0
+
+    print(f"{total_requests} searches, {concurrency} in flight")
+    print("-" * 72)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm up connections for both clients
+        await run_mode(search_threadpool, min(concurrency, 10), 20)
+        await run_mode(search_async, concurrency, concurrency)
+    for mode in modes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            throughput, latencies = await run_mode(MODES[mode], concurrency, total_requests)
+        print(f"{mode:<12}{throughput:10.1f} req/s   p50 {percentile(latencies, 0.50):8.1f} ms"
+              f"   p99 {percentile(latencies, 0.99):8.1f} ms")
+    await close_async_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--modes", default="blocking,threadpool,async")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests, args.modes.split(",")))
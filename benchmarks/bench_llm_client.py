@@ -0,0 +1,163 @@
+"""
+Connection reuse benchmark for the Gemini client
+
+Serves generateContent from a local stub HTTP server and times outfit-style
+calls through the google-genai SDK in three modes:
+
+  per-call      a new genai.Client per call (how outfit suggestions used to work)
+  shared        the process-wide client from llm_client.get_genai_client()
+  async-shared  the shared client's asyncio interface, --concurrency calls in flight
+
+The stub counts the TCP connections it accepts and waits --connect-ms on
+each new one, standing in for the TCP + TLS handshake to the real API
+(use 0 to measure the SDK alone). --model-ms adds a per-call model delay.
+No API key or network access is needed.
+
+Usage:
+    python benchmarks/bench_llm_client.py [--calls 200] [--connect-ms 30] [--model-ms 0] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search_index import percentile
+
+RESPONSE = json.dumps({
+    "candidates": [{
+        "content": {"role": "model", "parts": [{"text": json.dumps({
+            "outfit_suggestion": "Pair the navy blazer with the white shirt and dark jeans.",
+            "item_numbers": [1, 2, 3],
+        })}]},
+        "finishReason": "STOP",
+    }],
+}).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every concurrent connect; the default of 5 drops SYNs into a 1s retry
+    request_queue_size = 128
+
+    def __init__(self, connect_delay, model_delay):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.connect_delay = connect_delay
+        self.model_delay = model_delay
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real endpoint
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        time.sleep(self.server.connect_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.model_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def call(client):
+    return client.models.generate_content(model="gemini-2.5-pro", contents=["What should I wear?"])
+
+
+def run_per_call(calls, base_url):
+    from llm_client import create_genai_client
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        client = create_genai_client(api_key="stub", base_url=base_url)
+        call(client)
+        latencies.append((time.perf_counter() - started) * 1000)
+        client.close()
+    return latencies
+
+
+def run_shared(calls, base_url):
+    import llm_client
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call(llm_client.get_genai_client())
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def run_async_shared(calls, base_url, concurrency):
+    import llm_client
+    latencies = []
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                await llm_client.get_async_genai_client().models.generate_content(
+                    model="gemini-2.5-pro", contents=["What should I wear?"])
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(one() for _ in range(calls)))
+        await llm_client.close_genai_client()
+
+    asyncio.run(main())
+    return latencies
+
+
+def main(calls, connect_ms, model_ms, concurrency):
+    server = StubServer(connect_ms / 1000, model_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    # The shared client reads its endpoint and key from the environment on first use
+    os.environ["GOOGLE_API_KEY"] = "stub"
+    import llm_client
+    llm_client.GEMINI_BASE_URL = base_url
+
+    print(f"{calls} calls, {connect_ms} ms per new connection, {model_ms} ms per call")
+    print("-" * 80)
+    modes = [
+        ("per-call", lambda: run_per_call(calls, base_url)),
+        ("shared", lambda: run_shared(calls, base_url)),
+        (f"async-shared x{concurrency}", lambda: run_async_shared(calls, base_url, concurrency)),
+    ]
+    for name, run in modes:
+        before = server.connections
+        started = time.perf_counter()
+        latencies = run()
+        elapsed = time.perf_counter() - started
+        print(f"{name:<18}{calls / elapsed:9.1f} calls/s   p50 {percentile(latencies, 0.50):7.1f} ms"
+              f"   p99 {percentile(latencies, 0.99):7.1f} ms   {server.connections - before:5d} connections")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=30.0)
+    parser.add_argument("--model-ms", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    main(args.calls, args.connect_ms, args.model_ms, args.concurrency)
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark for natural language query parsing
+
+Compares the compiled single-pass parser in query_parser.py against the
+previous per-call dict rebuild + substring scan that lived in query_products.
+
+Usage:
+    python benchmarks/bench_query_parser.py [--iterations 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_parser import parse_query
+
+# Search strings taken from the README examples, the demo functions in
+# mongo_search.py and the extension's search box
+SEARCH_CORPUS = [
+    "blue shirts",
+    "red t-shirts",
+    "black jeans",
+    "white polo",
+    "green hoodie",
+    "multi shirts",
+    "red dresses",
+    "casual wear",
+    "navy blue slim fit chinos",
+    "light blue linen shirt",
+    "charcoal grey hoodie size xl",
+    "off-white cotton t-shirt",
+    "tan shorts for summer",
+    "black or navy jacket",
+    "olive green cargo pants",
+    "maroon sweater medium",
+    "printed short sleeve shirt",
+    "dark wash jeans size 32",
+    "shirred tank top",
+    "something for a beach wedding",
+]
+
+
+def legacy_parse(natural_language_query):
+    """The detection loop query_products used before the compiled parser"""
+    query_lower = natural_language_query.lower().strip()
+    color_keywords = {
+        'blue': ['blue', 'navy', 'dark blue', 'light blue'],
+        'red': ['red', 'maroon', 'crimson', 'cherry'],
+        'green': ['green', 'olive', 'forest green', 'lime'],
+        'black': ['black', 'dark'],
+        'white': ['white', 'cream', 'off-white'],
+        'grey': ['grey', 'gray', 'charcoal'],
+        'yellow': ['yellow', 'golden'],
+        'pink': ['pink', 'rose'],
+        'brown': ['brown', 'tan', 'beige'],
+        'purple': ['purple', 'violet'],
+        'orange': ['orange'],
+        'multi': ['multi', 'multicolor', 'printed', 'pattern']
+    }
+    category_mapping = {
+        'shirt': 'Shirts', 'shirts': 'Shirts',
+        't-shirt': 'T-shirts & Polos', 'tshirt': 'T-shirts & Polos',
+        't-shirts': 'T-shirts & Polos', 'tshirts': 'T-shirts & Polos',
+        'polo': 'T-shirts & Polos', 'polos': 'T-shirts & Polos',
+        'jeans': 'Jeans', 'pants': 'Trousers & Chinos',
+        'trousers': 'Trousers & Chinos', 'chinos': 'Trousers & Chinos',
+        'shorts': 'Shorts', 'jacket': 'Jackets & Coats',
+        'jackets': 'Jackets & Coats', 'sweater': 'Sweaters',
+        'sweaters': 'Sweaters', 'hoodie': 'Hoodies & Sweatshirts',
+        'hoodies': 'Hoodies & Sweatshirts'
+    }
+    detected_color = None
+    for color, variations in color_keywords.items():
+        if any(variation in query_lower for variation in variations):
+            detected_color = color
+            break
+    detected_category = None
+    for keyword, subcategory in category_mapping.items():
+        if keyword in query_lower:
+            detected_category = subcategory
+            break
+    return detected_color, detected_category
+
+
+def run(iterations):
+    print(f"Parsing {len(SEARCH_CORPUS)} queries x {iterations} iterations")
+    print("-" * 72)
+    print(f"{'query':<34}{'compiled (us)':>14}{'legacy (us)':>14}")
+    compiled_total = 0.0
+    legacy_total = 0.0
+    for query in SEARCH_CORPUS:
+        compiled = timeit.timeit(lambda: parse_query(query), number=iterations) / iterations * 1e6
+        legacy = timeit.timeit(lambda: legacy_parse(query), number=iterations) / iterations * 1e6
+        compiled_total += compiled
+        legacy_total += legacy
+        print(f"{query[:33]:<34}{compiled:>14.2f}{legacy:>14.2f}")
+    print("-" * 72)
+    count = len(SEARCH_CORPUS)
+    print(f"{'mean per query':<34}{compiled_total / count:>14.2f}{legacy_total / count:>14.2f}")
+
+    print("\nDetection differences (compiled vs legacy):")
+    for query in SEARCH_CORPUS:
+        parsed = parse_query(query)
+        legacy = legacy_parse(query)
+        if (parsed.color, parsed.category) != legacy:
+            print(f"  '{query}': {(parsed.color, parsed.category)} vs {legacy}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,122 @@
+"""
+Benchmark for the in-process product search index
+
+Builds the index over a synthetic catalog shaped like the products
+collection, reports memory use and p50/p99 search latency for the query
+corpus, and optionally times the MongoDB query_products path for comparison.
+
+Usage:
+    python benchmarks/bench_search_index.py [--products 100000] [--rounds 50] [--mongo]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_query_parser import SEARCH_CORPUS
+from query_parser import CATEGORY_MAPPING, COLOR_KEYWORDS, parse_query
+from search_index import ProductSearchIndex
+
+TITLE_WORDS = [
+    "men's", "women's", "classic", "slim", "fit", "regular", "cotton", "linen",
+    "casual", "button", "down", "long", "short", "sleeve", "crew", "neck",
+    "summer", "beach", "resort", "hawaiian", "stretch", "denim", "cargo",
+    "pullover", "zip", "lightweight", "oxford", "vintage", "graphic", "wash",
+]
+
+
+def synthetic_products(count, seed=7):
+    rng = random.Random(seed)
+    colors = [variation for variations in COLOR_KEYWORDS.values() for variation in variations]
+    categories = sorted(set(CATEGORY_MAPPING.values()))
+    products = []
+    for i in range(count):
+        color = rng.choice(colors).title()
+        category = rng.choice(categories)
+        title_words = rng.sample(TITLE_WORDS, rng.randint(4, 9))
+        products.append({
+            "_id": i,
+            "product_title": f"{' '.join(title_words).title()} {color} {category.split(' & ')[0]}",
+            "product_url": f"https://www.amazon.com/dp/B0{i:08d}",
+            "product_price": f"{rng.uniform(8, 120):.2f}",
+            "product_color": color,
+            "product_size": rng.choice(["S", "M", "L", "XL"]),
+            "product_category": category,
+            "image_url": f"https://m.media-amazon.com/images/I/{i:010d}.jpg",
+        })
+    return products
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_queries(search, rounds):
+    samples = []
+    for _ in range(rounds):
+        for query in SEARCH_CORPUS:
+            started = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<28} p50 {percentile(samples, 0.50):8.3f} ms   p99 {percentile(samples, 0.99):8.3f} ms")
+
+
+def run(product_count, rounds, mongo):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    products = synthetic_products(product_count)
+    documents = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    index = ProductSearchIndex()
+    started = time.perf_counter()
+    index.build_from_documents(products)
+    build_seconds = time.perf_counter() - started
+
+    # Second build under tracemalloc to measure the index structures alone
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    measured = ProductSearchIndex()
+    measured.build_from_documents(synthetic_products(product_count))
+    indexed = tracemalloc.get_traced_memory()[0] - baseline - documents
+    tracemalloc.stop()
+    del measured
+
+    scale = 100000 / product_count / 2**20
+    print(f"Indexed {product_count} products in {build_seconds:.2f}s")
+    print(f"Memory per 100k products: {documents * scale:.1f} MiB projected documents + "
+          f"{indexed * scale:.1f} MiB postings/filters")
+    print(f"Stats: {index.stats()}")
+    print()
+
+    def search_index(query):
+        return index.search(parse_query(query), limit=10)
+
+    time_queries(search_index, 1)  # warm the per-term BM25 impact cache
+    report("search index", time_queries(search_index, rounds))
+
+    if mongo:
+        from mongo_search import query_products
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples = time_queries(query_products, max(1, rounds // 10))
+        report("mongo query_products", samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--mongo", action="store_true", help="also time query_products against the configured cluster")
+    args = parser.parse_args()
+    run(args.products, args.rounds, args.mongo)
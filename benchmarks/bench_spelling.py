@@ -0,0 +1,114 @@
+"""
+Micro-benchmark for query spelling correction
+
+Times SpellingCorrector.lookup on misspelled search words, both cold (every
+lookup recomputed) and warm (memoized), against a dictionary of the parser's
+keyword tables plus a synthetic catalog vocabulary.
+
+First it checks the process-wide spelling_corrector seeded the way the
+server seeds it (keywords, occasion words, then catalog words): typos are
+left alone until the catalog words are loaded, and afterwards typos of
+occasion words are fixed while real words stay as typed. The script exits
+with status 1 if any query comes out wrong.
+
+Usage:
+    python benchmarks/bench_spelling.py [--iterations 2000] [--catalog-words 5000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spelling import SpellingCorrector, _keyword_words, KEYWORD_COUNT, spelling_corrector
+
+MISSPELLINGS = [
+    "jakcet",
+    "hoddie",
+    "swetshirt",
+    "shrit",
+    "trouzers",
+    "chinoes",
+    "nvy",
+    "grafic",
+    "oversised",
+    "strped",
+]
+
+# Title words of a small real-looking catalog, on top of the synthetic vocabulary
+CATALOG_WORDS = {"tank": 40, "top": 120, "button": 35, "down": 20, "nike": 15, "tee": 60, "hoodies": 80, "jacket": 50}
+
+# Query -> expected correction once the catalog words are loaded
+SERVER_QUERIES = {
+    "beech shirts": "beach shirts",
+    "wintr jacket": "winter jacket",
+    "blu hoddies": "blue hoodies",
+    "tank top": "tank top",
+    "button down": "button down",
+    "nike tee": "nike tee",
+}
+
+
+def synthetic_vocabulary(count, seed=7):
+    rng = random.Random(seed)
+    return {
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))): rng.randint(1, 500)
+        for _ in range(count)
+    }
+
+
+def check_server_seeding(catalog_words):
+    # Same calls as server.py: occasion words at import, catalog words in the background
+    from semantic_index import CONCEPT_EXPANSIONS
+    spelling_corrector.add_words(CONCEPT_EXPANSIONS.keys(), count=KEYWORD_COUNT)
+    failures = 0
+    print(f"{'query':<16}{'before catalog':<20}{'after catalog':<20}")
+    before = {query: spelling_corrector.correct(query) for query in SERVER_QUERIES}
+    spelling_corrector.add_words({**synthetic_vocabulary(catalog_words), **CATALOG_WORDS})
+    spelling_corrector.ready = True
+    for query, expected in SERVER_QUERIES.items():
+        after = spelling_corrector.correct(query)
+        ok = before[query] == query and after == expected
+        failures += not ok
+        print(f"{query:<16}{before[query]:<20}{after:<20}{'' if ok else 'expected ' + expected}")
+    print()
+    return failures
+
+
+def run(iterations, catalog_words):
+    corrector = SpellingCorrector()
+    corrector.add_words(_keyword_words(), count=KEYWORD_COUNT)
+    corrector.add_words(synthetic_vocabulary(catalog_words))
+    print(f"Dictionary: {len(corrector)} words, {len(corrector._deletes)} delete keys")
+    print("-" * 60)
+    print(f"{'token':<14}{'correction':<14}{'cold (us)':>16}{'warm (us)':>16}")
+
+    def cold(token):
+        corrector._corrections = {}
+        corrector.lookup(token)
+
+    cold_total = 0.0
+    warm_total = 0.0
+    for token in MISSPELLINGS:
+        cold_us = timeit.timeit(lambda: cold(token), number=iterations) / iterations * 1e6
+        corrector.lookup(token)
+        warm_us = timeit.timeit(lambda: corrector.lookup(token), number=iterations) / iterations * 1e6
+        cold_total += cold_us
+        warm_total += warm_us
+        print(f"{token:<14}{corrector.lookup(token):<14}{cold_us:>16.2f}{warm_us:>16.2f}")
+    print("-" * 60)
+    count = len(MISSPELLINGS)
+    print(f"{'mean per token':<28}{cold_total / count:>16.2f}{warm_total / count:>16.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--catalog-words", type=int, default=5000)
+    args = parser.parse_args()
+    failures = check_server_seeding(args.catalog_words)
+    run(args.iterations, args.catalog_words)
+    sys.exit(1 if failures else 0)
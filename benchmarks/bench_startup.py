@@ -0,0 +1,75 @@
+"""
+Cold-start benchmark for the API worker
+
+Imports a module (server by default) in fresh interpreters with
+``python -X importtime`` and reports the median wall time plus the top-level
+modules imported directly by it that cost the most cumulative import time.
+
+Usage:
+    python benchmarks/bench_startup.py [--module server] [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once(module):
+    env = dict(os.environ)
+    # server.py refuses to start without a key; it is never used during import
+    env.setdefault("GOOGLE_API_KEY", "benchmark")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return elapsed, completed.stderr
+
+
+def parse_importtime(stderr, module):
+    # Lines look like "import time:       123 |       4567 |   package.sub";
+    # each nesting level adds two spaces and children precede their parent
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        name = raw_name.strip()
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name == module:
+                return children
+            children = {}
+        elif depth == 1:
+            children[name] = int(cumulative_us)
+    return children
+
+
+def run(module, runs, top):
+    timings = []
+    stderr = ""
+    for _ in range(runs):
+        elapsed, stderr = import_once(module)
+        timings.append(elapsed)
+    print(f"import {module}: median {statistics.median(timings) * 1000:.0f} ms over {runs} runs "
+          f"(min {min(timings) * 1000:.0f} ms, includes interpreter start)")
+    print("-" * 60)
+    print(f"{'imported by ' + module:<40}{'cumulative (ms)':>20}")
+    for name, us in sorted(parse_importtime(stderr, module).items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:<40}{us / 1000:>20.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    run(args.module, args.runs, args.top)
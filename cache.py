@@ -0,0 +1,105 @@
+"""
+Bounded in-process LRU cache with per-entry TTL
+
+Used to keep hot MongoDB results in memory. Entries are evicted when the
+cache is full (least recently used first) or when they are older than the
+TTL. Invalidation bumps a generation counter so a result computed before an
+invalidation cannot be written back afterwards.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after insertion"""
+
+    def __init__(self, maxsize=1024, ttl=60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Look up a key, counting the hit or miss
+
+        Args:
+            key: Hashable cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > self._timer():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, generation=None):
+        """
+        Store a value, evicting the least recently used entry when full
+
+        Args:
+            key: Hashable cache key
+            value: Value to cache
+            generation (int, optional): ``generation`` read before computing the
+                value; the write is dropped if the cache was invalidated since
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self._timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """
+        Drop one key, or every entry when no key is given
+
+        Args:
+            key (optional): Cache key to drop
+        """
+        with self._lock:
+            self.generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Report cache effectiveness
+
+        Returns:
+            dict: Size, capacity, hit/miss/eviction counters and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
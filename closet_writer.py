@@ -0,0 +1,216 @@
+"""
+Write-behind buffer for closet adds
+
+Adds from concurrent requests are queued in memory and written together:
+a batch is flushed with one unordered bulk_write of upserts as soon as it
+holds CLOSET_WRITE_BATCH_SIZE items, or CLOSET_WRITE_MAX_DELAY_MS after its
+oldest item was queued. Each caller awaits its own future, which resolves
+only after the flush was acknowledged with the configured write concern
+(majority and journaled by default), so an add still returns only once it is
+durable. Under bursty traffic N adds cost one write round trip instead of N.
+
+The buffer runs on the event loop (start() in the app lifespan, stop()
+flushes what is left). While it is not running, callers write directly.
+"""
+import asyncio
+import logging
+import os
+
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+
+from mongo_search import closet_batch_upserts, split_closet_batch_writes
+from timing import span
+
+logger = logging.getLogger(__name__)
+
+CLOSET_WRITE_BUFFER_ENABLED = os.getenv("CLOSET_WRITE_BUFFER_ENABLED", "true").lower() in ("1", "true", "yes")
+CLOSET_WRITE_BATCH_SIZE = int(os.getenv("CLOSET_WRITE_BATCH_SIZE", "100"))
+CLOSET_WRITE_MAX_DELAY_MS = float(os.getenv("CLOSET_WRITE_MAX_DELAY_MS", "5"))
+# "majority", or a number of members
+CLOSET_WRITE_CONCERN = os.getenv("CLOSET_WRITE_CONCERN", "majority")
+CLOSET_WRITE_JOURNAL = os.getenv("CLOSET_WRITE_JOURNAL", "true").lower() in ("1", "true", "yes")
+
+
+def closet_write_concern(w=CLOSET_WRITE_CONCERN, journal=CLOSET_WRITE_JOURNAL):
+    """
+    Write concern for buffered closet flushes
+
+    Args:
+        w (str): "majority" or a number of members
+        journal (bool): Wait for the journal commit
+
+    Returns:
+        WriteConcern: Concern applied to every flush
+    """
+    return WriteConcern(w=int(w) if w.isdigit() else w, j=journal)
+
+
+class ClosetWriteBuffer:
+    """
+    Batches closet item upserts from concurrent callers
+
+    Args:
+        get_collection (callable): Returns the closets collection (async client)
+        batch_size (int): Flush as soon as this many items are queued
+        max_delay (float): Seconds an item may wait for its batch to fill
+        write_concern (WriteConcern): Acknowledgement a flush waits for
+    """
+
+    def __init__(self, get_collection, batch_size=CLOSET_WRITE_BATCH_SIZE,
+                 max_delay=CLOSET_WRITE_MAX_DELAY_MS / 1000, write_concern=None):
+        self._get_collection = get_collection
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.write_concern = write_concern or closet_write_concern()
+        # (document, future, queued_at) in arrival order
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.flushes = 0
+        self.flushed_items = 0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._closing
+
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self._task is None:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="closet-write-buffer")
+
+    async def stop(self):
+        """Flush every queued item, then stop the flush loop"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    async def add(self, document):
+        """
+        Queue a closet item and wait until it is durably written
+
+        Args:
+            document (dict): Closet item from build_closet_item
+
+        Returns:
+            str: _id of the closet item (the existing one if the product was already present)
+
+        Raises:
+            RuntimeError: If the buffer is not running
+            Exception: The write error of this item, if its flush failed
+        """
+        if not self.running:
+            raise RuntimeError("Closet write buffer is not running")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((document, future, loop.time()))
+        # Wake the loop to start the batch's clock, or to flush a full batch
+        if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return await future
+
+    def stats(self):
+        """
+        Report buffer activity
+
+        Returns:
+            dict: Running state, queued items, flushes and average batch size
+        """
+        return {
+            "running": self.running,
+            "queued": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_items": self.flushed_items,
+            "average_batch": round(self.flushed_items / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            remaining = self._pending[0][2] + self.max_delay - loop.time()
+            if remaining > 0 and len(self._pending) < self.batch_size and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Closet write flush failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, batch):
+        documents = [document for document, _, _ in batch]
+        collection = self._get_collection().with_options(write_concern=self.write_concern)
+        try:
+            with span("closet-flush"):
+                upserted_ids = (await collection.bulk_write(closet_batch_upserts(documents), ordered=False)).upserted_ids
+            write_errors = ()
+        except BulkWriteError as e:
+            upserted_ids = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
+            write_errors = e.details.get("writeErrors", [])
+        self.flushes += 1
+        self.flushed_items += len(batch)
+
+        failed, existing_product_ids = split_closet_batch_writes(documents, upserted_ids, write_errors)
+        existing_ids = {}
+        if existing_product_ids:
+            # Already-present products (possibly of several users) resolve to their existing items
+            with span("mongo-closet"):
+                keys = [{"user_id": document["user_id"], "original_product_id": document["original_product_id"]}
+                        for index, document in enumerate(documents) if index not in upserted_ids and index not in failed]
+                existing = await collection.find({"$or": keys}, {"user_id": 1, "original_product_id": 1}).to_list()
+                existing_ids = {(item["user_id"], item["original_product_id"]): item["_id"] for item in existing}
+
+        for index, (document, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            key = (document["user_id"], document["original_product_id"])
+            if index in upserted_ids:
+                future.set_result(str(upserted_ids[index]))
+            elif key in existing_ids:
+                future.set_result(str(existing_ids[key]))
+            else:
+                future.set_exception(RuntimeError(failed.get(index, "Closet write failed")))
+
+
+def write_buffer_collector(buffer):
+    """
+    Collector reporting flushes, flushed items and queue length of a ClosetWriteBuffer
+
+    Args:
+        buffer (ClosetWriteBuffer): Buffer to report
+
+    Returns:
+        callable: Collector for metrics.register_collector
+    """
+    def collect():
+        stats = buffer.stats()
+        return [
+            ("closet_write_flushes_total", "counter", "Buffered closet flushes (one bulk_write each)", [({}, stats["flushes"])]),
+            ("closet_write_items_total", "counter", "Closet adds written by buffered flushes", [({}, stats["flushed_items"])]),
+            ("closet_write_queued", "gauge", "Closet adds waiting for the next flush", [({}, stats["queued"])]),
+        ]
+    return collect
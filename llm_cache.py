@@ -0,0 +1,138 @@
+"""
+Two-tier cache for LLM responses
+
+Lookups try an in-process TTLCache (LRU) first, then a SQLite file shared
+by every worker on the host, so an answer computed once is served to all
+workers and survives restarts. Both tiers expire entries after the same TTL.
+A disk hit is copied into the memory tier.
+
+Values must be JSON-serializable (ObjectIds are stored as strings). Callers
+build keys that change whenever the answer would, e.g. from a fingerprint
+of the closet contents, so no explicit invalidation is needed.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Memory LRU tier over an optional SQLite tier
+
+    Args:
+        path (str, optional): SQLite file for the disk tier (None: memory only)
+        maxsize (int): Entries kept in memory
+        ttl (float): Seconds an entry stays valid in either tier
+    """
+
+    def __init__(self, path=None, maxsize=512, ttl=24 * 3600.0):
+        self.path = path
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Opened on first use; check_same_thread=False because the threadpool and
+        # asyncio.to_thread callers share it under self._lock
+        if self._db is None and self.path:
+            try:
+                db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._db = db
+            except sqlite3.Error as e:
+                logger.warning(f"LLM response cache disabled on disk ({self.path}): {e}")
+                self.path = None
+        return self._db
+
+    def get(self, key):
+        """
+        Look up a response, memory first
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            The cached value, or None on a miss in both tiers
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM response cache read failed: {e}")
+                return None
+            if row is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        value = json.loads(row[0])
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        Store a response in both tiers
+
+        Args:
+            key (str): Cache key
+            value: JSON-serializable response
+        """
+        self.memory.set(key, value)
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                           (key, json.dumps(value, default=str), time.time() + self.ttl))
+            except sqlite3.Error as e:
+                logger.warning(f"LLM response cache write failed: {e}")
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        self.memory.invalidate()
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM responses")
+
+    def close(self):
+        """Close the SQLite connection (the memory tier stays usable)"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        """
+        Report cache effectiveness in the TTLCache.stats() shape
+
+        Returns:
+            dict: Memory-tier size and evictions; hits count both tiers, misses are misses in both
+        """
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            **memory,
+            "hits": hits,
+            "misses": lookups - hits,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,82 @@
+"""
+Shared Google Gemini client
+
+Every Gemini call in the process goes through one genai.Client, created on
+first use: photo generation in server.py and outfit suggestions in
+mongo_search.py / mongo_async.py. The client's HTTP connection pool is
+reused across requests, so a call only pays for TCP and TLS setup when the
+pool has no idle connection, instead of on every request. Async code uses
+get_async_genai_client(), the same client's asyncio interface (its own
+connection pool, shared by all coroutines).
+
+GEMINI_BASE_URL sends requests to another endpoint, e.g. the local stub of
+benchmarks/bench_llm_client.py.
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_genai_client(api_key=None, base_url=None):
+    """
+    Build a new Gemini client (use get_genai_client() to share one)
+
+    Args:
+        api_key (str, optional): API key (defaults to GOOGLE_API_KEY)
+        base_url (str, optional): Endpoint overriding the Gemini API URL (defaults to GEMINI_BASE_URL)
+
+    Returns:
+        genai.Client: New client with its own connection pools
+    """
+    from google import genai
+
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is required")
+    base_url = base_url or GEMINI_BASE_URL
+    http_options = {"base_url": base_url} if base_url else None
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def get_genai_client():
+    """
+    Process-wide Gemini client, created on first use
+
+    Returns:
+        genai.Client: Client authenticated with GOOGLE_API_KEY
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                logger.info("Initializing Google Gemini client...")
+                _client = create_genai_client()
+                logger.info("Google Gemini client initialized successfully")
+    return _client
+
+
+def get_async_genai_client():
+    """
+    Asyncio interface of the shared Gemini client
+
+    Returns:
+        genai.client.AsyncClient: ``get_genai_client().aio``
+    """
+    return get_genai_client().aio
+
+
+async def close_genai_client():
+    """Close the shared client's connection pools (on shutdown)"""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aio.aclose()
+        client.close()
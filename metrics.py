@@ -0,0 +1,274 @@
+"""
+Process metrics in the Prometheus text exposition format
+
+Counters, gauges and histograms are sharded per thread: each thread only
+ever updates its own shard, so recording a value takes no lock (the lock is
+taken once per thread and metric, when the shard is created). A scrape sums
+the shards. Gauges are sharded the same way, so a value raised in one thread
+and lowered in another still adds up.
+
+Request metrics come from MetricsMiddleware. Dependency metrics (MongoDB,
+Gemini, Selenium, S3, image download) come from the timing spans: every
+``with span(...)`` also observes stage_duration_seconds, stage_in_flight and,
+when it raises, stage_errors_total. Values computed at scrape time, like
+cache hit ratios, are added with register_collector().
+"""
+import bisect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans range from sub-millisecond cache lookups to 30s image generation
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Per-thread shards of label values -> state"""
+
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Thread ident -> shard; a thread reusing a finished thread's ident continues its shard
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = self._shards.get(threading.get_ident())
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(threading.get_ident(), {})
+        return shard
+
+    def _snapshots(self):
+        with self._lock:
+            shards = list(self._shards.values())
+        # dict.copy() is atomic under the GIL, even while the owner thread writes
+        return [shard.copy() for shard in shards]
+
+    def expose(self):
+        """
+        Render the metric in the text exposition format
+
+        Returns:
+            list: Lines, starting with the HELP and TYPE comments
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests or errors"""
+
+    type_name = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return sum(shard.get(labelvalues, 0) for shard in self._snapshots())
+
+    def _totals(self):
+        totals = {}
+        for shard in self._snapshots():
+            for labelvalues, value in shard.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return totals
+
+    def _samples(self):
+        for labelvalues, value in sorted(self._totals().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight"""
+
+    type_name = "gauge"
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets, e.g. latencies in seconds"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # One count per bucket plus +Inf, then sum and count
+            state = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self):
+        totals = {}
+        for shard in self._snapshots():
+            for labelvalues, state in shard.items():
+                total = totals.get(labelvalues)
+                if total is None:
+                    totals[labelvalues] = list(state)
+                else:
+                    for i, value in enumerate(state):
+                        total[i] += value
+        bounds = self.buckets + (float("inf"),)
+        for labelvalues, state in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(float(bound))}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+_metrics = []
+_collectors = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    """
+    Add metrics computed at scrape time
+
+    Args:
+        collector (callable): Returns a list of (name, type, help, [(labels dict, value)])
+    """
+    _collectors.append(collector)
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format
+
+    Returns:
+        str: Exposition text, newline terminated
+    """
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.expose())
+    for collector in _collectors:
+        for name, type_name, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def cache_collector(caches):
+    """
+    Collector reporting hits, misses, evictions, size and hit ratio of TTLCaches
+
+    Args:
+        caches (dict): Cache name -> TTLCache
+
+    Returns:
+        callable: Collector for register_collector
+    """
+    def collect():
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        return [
+            ("cache_hits_total", "counter", "Cache lookups answered from the cache",
+             [({"cache": name}, s["hits"]) for name, s in stats.items()]),
+            ("cache_misses_total", "counter", "Cache lookups that missed",
+             [({"cache": name}, s["misses"]) for name, s in stats.items()]),
+            ("cache_evictions_total", "counter", "Entries evicted to stay within maxsize",
+             [({"cache": name}, s["evictions"]) for name, s in stats.items()]),
+            ("cache_entries", "gauge", "Entries currently cached",
+             [({"cache": name}, s["size"]) for name, s in stats.items()]),
+            ("cache_hit_ratio", "gauge", "Hits / (hits + misses) since start",
+             [({"cache": name}, s["hit_ratio"]) for name, s in stats.items()]),
+        ]
+    return collect
+
+
+http_requests_total = _register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_request_duration_seconds = _register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_requests_in_flight = _register(Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ("method",)))
+stage_duration_seconds = _register(Histogram(
+    "stage_duration_seconds", "Duration of timed stages (MongoDB, Gemini, Selenium, S3, ...)", ("stage",)))
+stage_in_flight = _register(Gauge(
+    "stage_in_flight", "Timed stages currently running", ("stage",)))
+stage_errors_total = _register(Counter(
+    "stage_errors_total", "Timed stages that raised", ("stage",)))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests and their latency per route
+
+    Routes are labelled by their path template ("/closet-items"), so
+    unknown paths cannot grow the label set; unmatched requests share
+    route="unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # The route is only known once routing ran, so in-flight requests are counted per method
+        http_requests_in_flight.inc(method)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec(method)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            http_requests_total.inc(method, route, str(status))
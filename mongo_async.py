@@ -0,0 +1,564 @@
+"""
+Async MongoDB data access for the FastAPI endpoints
+
+Async twins of the request-path functions in mongo_search.py, built on
+PyMongo's native asyncio client (AsyncMongoClient), so a slow query only
+suspends the request that issued it instead of blocking the event loop.
+Query building, caching and serialization are shared with mongo_search; only
+the I/O differs.
+
+The client is created on first use, inside the running event loop, with the
+same pool/timeout/compression options as the sync client. warm_up() opens
+pool connections before traffic arrives and records readiness for /health.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from mongo_search import (
+    uri, DB_NAME, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_CLOSET_PAGE_SIZE, DEFAULT_USER_ID, CLOSET_INDEXES, CLOSET_SORT,
+    CLOSET_CLEAR_BATCH_SIZE,
+    MONGO_MIN_POOL_SIZE, client_options, ping,
+    product_search_cache, product_facets_cache, closet_summary_cache, invalidate_closet_summary,
+    search_cache_key, plan_search_page, plan_search_batch, make_search_page, _dedupe_batch,
+    OUTFIT_SUGGESTION_MODEL, OUTFIT_CLOSET_PROJECTION, outfit_response_cache, build_outfit_prompt, outfit_cache_key,
+    parse_outfit_answer, make_outfit_result, outfit_error,
+    facet_stages, format_facets, closet_summary_pipeline, format_closet_summary, build_closet_item, plan_closet_page, make_closet_page, closet_page_projection,
+    closet_owner_filter, closet_item_key, closet_item_upsert, parse_product_ids, build_closet_batch, closet_batch_upserts,
+    split_closet_batch_writes, record_closet_batch_writes,
+)
+from closet_writer import ClosetWriteBuffer
+from llm_client import get_async_genai_client
+from query_parser import parse_query
+from serializers import PRODUCT_PROJECTION, CLOSET_ITEM_PROJECTION
+from timing import span
+
+logger = logging.getLogger(__name__)
+
+# Connections opened by warm_up(); defaults to the pool minimum
+MONGO_WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS", "0")) or max(MONGO_MIN_POOL_SIZE, 1)
+# Startup never waits longer than this (plus one readiness ping) for MongoDB
+MONGO_WARMUP_TIMEOUT_SECONDS = float(os.getenv("MONGO_WARMUP_TIMEOUT_SECONDS", "5"))
+READINESS_TIMEOUT_SECONDS = 2.0
+READINESS_MAX_AGE_SECONDS = 10.0
+
+_client = None
+
+# Last known MongoDB reachability, reported by /health
+readiness = {"ready": False, "ping_ms": None, "error": None, "checked_at": None}
+
+# Write-behind buffer for single closet adds; started and stopped by the app lifespan
+closet_write_buffer = ClosetWriteBuffer(lambda: get_async_db()["closets"])
+
+# Owner (None for every closet) -> running background clear, so repeated DELETEs share one
+_closet_clears = {}
+
+
+def get_async_db():
+    """
+    Database handle on the shared async client
+
+    Returns:
+        AsyncDatabase: The configured database
+    """
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(uri, **client_options())
+    return _client.get_database(DB_NAME)
+
+
+async def close_async_client():
+    """Close the shared async client, if one was created"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+async def check_readiness(timeout=READINESS_TIMEOUT_SECONDS):
+    """
+    Ping MongoDB through the async client and record the outcome
+
+    Args:
+        timeout (float): Seconds to wait before reporting not ready
+
+    Returns:
+        dict: Copy of readiness (ready, ping_ms, error, checked_at)
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_async_db().command('ping'), timeout)
+        readiness.update(ready=True, ping_ms=round((time.perf_counter() - started) * 1000, 2), error=None)
+    except Exception as e:
+        readiness.update(ready=False, ping_ms=None, error=str(e) or type(e).__name__)
+    readiness["checked_at"] = time.time()
+    return dict(readiness)
+
+
+async def current_readiness(max_age=READINESS_MAX_AGE_SECONDS):
+    """
+    Recent readiness, re-checked when stale or not ready
+
+    Args:
+        max_age (float): Seconds a successful check stays valid
+
+    Returns:
+        dict: Copy of readiness (ready, ping_ms, error, checked_at)
+    """
+    if readiness["ready"] and time.time() - readiness["checked_at"] < max_age:
+        return dict(readiness)
+    return await check_readiness()
+
+
+async def warm_up(connections=MONGO_WARMUP_CONNECTIONS, timeout=MONGO_WARMUP_TIMEOUT_SECONDS):
+    """
+    Open pool connections on both clients before the first request
+
+    Concurrent pings force the async pool to open ``connections`` sockets
+    (TLS and auth included); the sync client used by background jobs gets
+    one. The pings get ``timeout`` seconds, so an unreachable MongoDB
+    delays startup by at most that plus one readiness check. Failures are
+    logged and leave readiness false; /health retries.
+
+    Args:
+        connections (int): Async connections to open
+        timeout (float): Seconds to wait for the pings
+
+    Returns:
+        dict: Copy of readiness after warm-up
+    """
+    started = time.perf_counter()
+
+    async def open_connections():
+        db = get_async_db()
+        await asyncio.gather(*(db.command('ping') for _ in range(connections)))
+        await asyncio.to_thread(ping)
+
+    try:
+        await asyncio.wait_for(open_connections(), timeout)
+    except Exception as e:
+        logger.warning(f"MongoDB warm-up failed: {str(e) or type(e).__name__}")
+    status = await check_readiness()
+    if status["ready"]:
+        logger.info(f"MongoDB pool warmed up with {connections} connections in {time.perf_counter() - started:.2f}s")
+    return status
+
+
+async def ensure_closet_indexes_async():
+    """
+    Async version of mongo_search.ensure_closet_indexes (no-op when the indexes exist)
+
+    Returns:
+        list: Names of the ensured indexes
+    """
+    closets_collection = get_async_db()["closets"]
+    return [await closets_collection.create_index(keys, name=name, **options) for keys, name, options in CLOSET_INDEXES]
+
+
+async def get_global_facets_async():
+    """
+    Async version of mongo_search.get_global_facets (shares its cache)
+
+    Returns:
+        dict: "colors" and "categories" lists of {"value", "count"}, most common first
+    """
+    facets = product_facets_cache.get("global")
+    if facets is None:
+        generation = product_facets_cache.generation
+        with span("mongo-facets"):
+            cursor = await get_async_db()["products"].aggregate([{"$facet": facet_stages()}])
+            results = await cursor.to_list()
+        facets = format_facets(results[0] if results else {})
+        product_facets_cache.set("global", facets, generation=generation)
+    return facets
+
+
+async def search_products_page_async(natural_language_query, page_size=DEFAULT_PAGE_SIZE, cursor=None, facets=False):
+    """
+    Async version of mongo_search.search_products_page (shares its cache)
+
+    Args:
+        natural_language_query (str): Natural language query like "blue shirts"
+        page_size (int): Number of products per page (capped at MAX_PAGE_SIZE)
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        facets (bool): Also count matches per color and category
+
+    Returns:
+        dict: "products" for this page, "next_cursor" (None on the last page)
+            and, when requested, "facets"
+    """
+    products_collection = get_async_db()["products"]
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    parsed = parse_query(natural_language_query)
+
+    cache_key = search_cache_key(parsed, page_size, cursor, facets)
+    cached_page = product_search_cache.get(cache_key)
+    if cached_page is not None:
+        return cached_page
+    generation = product_search_cache.generation
+
+    plan = plan_search_page(parsed, page_size, cursor, facets)
+    if "pipeline" in plan:
+        with span("mongo-search"):
+            aggregation = await products_collection.aggregate(plan["pipeline"])
+            output = await aggregation.to_list()
+        result = output[0] if output else {}
+        results = result.get("hits", [])
+        facet_counts = format_facets(result)
+    else:
+        find_cursor = products_collection.find(plan["filter"], plan["projection"]).sort(plan["sort"]).limit(plan["limit"])
+        with span("mongo-search"):
+            results = await find_cursor.to_list()
+        # An unfiltered query matches the whole catalog
+        facet_counts = await get_global_facets_async() if facets else None
+
+    page = make_search_page(results, page_size, plan["sort_field"])
+    if facets:
+        page["facets"] = facet_counts
+    product_search_cache.set(cache_key, page, generation=generation)
+    return page
+
+
+async def query_products_async(natural_language_query):
+    """
+    Async version of mongo_search.query_products
+
+    Args:
+        natural_language_query (str): Natural language query like "blue shirts"
+
+    Returns:
+        list: Matching product documents (MAX 10)
+    """
+    page = await search_products_page_async(natural_language_query)
+    return page["products"]
+
+
+async def search_products_batch_async(natural_language_queries, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Async version of mongo_search.search_products_batch (shares its cache)
+
+    Args:
+        natural_language_queries (list): Queries like ["blue shirts", "jeans under $40"]
+        page_size (int): Number of products per page (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        list: One {"products", "next_cursor"} page per input query, in input order
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    query_keys, pages, pending = _dedupe_batch(natural_language_queries, page_size)
+
+    if pending:
+        generation = product_search_cache.generation
+        pipeline, branches = plan_search_batch(pending, page_size)
+        with span("mongo-batch"):
+            aggregation = await get_async_db()["products"].aggregate(pipeline)
+            output = await aggregation.to_list()
+        results = output[0] if output else {}
+        for branch, (key, sort_field) in branches.items():
+            page = make_search_page(results.get(branch, []), page_size, sort_field)
+            product_search_cache.set(key, page, generation=generation)
+            pages[key] = page
+
+    return [pages[key] for key in query_keys]
+
+
+async def get_products_by_ids_async(product_ids, projection=PRODUCT_PROJECTION):
+    """
+    Async version of mongo_search.get_products_by_ids
+
+    Args:
+        product_ids (list): Product _ids as strings
+        projection (dict, optional): Fields to fetch (defaults to the product response fields)
+
+    Returns:
+        list: Product documents in product_ids order (missing ids are skipped)
+    """
+    object_ids = [ObjectId(product_id) for product_id in product_ids]
+    with span("mongo-products"):
+        documents = await get_async_db()["products"].find({"_id": {"$in": object_ids}}, projection).to_list()
+    products = {product["_id"]: product for product in documents}
+    return [products[object_id] for object_id in object_ids if object_id in products]
+
+
+async def add_product_to_closet_async(product_id, user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.add_product_to_closet
+
+    Args:
+        product_id (str): The MongoDB _id of the product to add
+        user_id (str): Owner of the closet
+
+    Returns:
+        str: The closet item's document ID (existing or new) or None if failed
+    """
+    try:
+        db = get_async_db()
+        with span("mongo-product"):
+            product = await db["products"].find_one({"_id": ObjectId(product_id)}, PRODUCT_PROJECTION)
+        if not product:
+            logger.info(f"Product with ID {product_id} not found")
+            return None
+
+        closet_item = build_closet_item(product, user_id)
+        if closet_write_buffer.running:
+            # Batched with concurrent adds; resolves once the flush is durable
+            closet_item_id = await closet_write_buffer.add(closet_item)
+            invalidate_closet_summary(user_id)
+            return closet_item_id
+        try:
+            with span("mongo-insert"):
+                saved = await db["closets"].find_one_and_update(
+                    closet_item_key(closet_item), closet_item_upsert(closet_item),
+                    projection={"_id": 1}, upsert=True, return_document=ReturnDocument.AFTER
+                )
+        except DuplicateKeyError:
+            # A concurrent add of the same product won the insert
+            saved = await db["closets"].find_one(closet_item_key(closet_item), {"_id": 1})
+        invalidate_closet_summary(user_id)
+        return str(saved["_id"])
+    except Exception as e:
+        logger.error(f"Error adding product to closet: {e}")
+        return None
+
+
+async def add_products_to_closet_async(product_ids, user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.add_products_to_closet
+
+    Args:
+        product_ids (list): Product _ids as strings (at most MAX_CLOSET_BATCH_SIZE)
+        user_id (str): Owner of the closet
+
+    Returns:
+        list: One {"product_id", "success", "mongodb_id" and "created", or "error"}
+            per requested ID, in order
+    """
+    db = get_async_db()
+    closets_collection = db["closets"]
+    object_ids = parse_product_ids(product_ids)
+    products = {}
+    if object_ids:
+        with span("mongo-products"):
+            cursor = db["products"].find({"_id": {"$in": list(set(object_ids.values()))}}, PRODUCT_PROJECTION)
+            products = {product["_id"]: product for product in await cursor.to_list()}
+
+    results, documents, positions = build_closet_batch(product_ids, object_ids, products, user_id)
+    if not documents:
+        return results
+    try:
+        with span("mongo-insert"):
+            upserted_ids = (await closets_collection.bulk_write(closet_batch_upserts(documents), ordered=False)).upserted_ids
+        write_errors = ()
+    except BulkWriteError as e:
+        upserted_ids = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
+        write_errors = e.details.get("writeErrors", [])
+
+    failed, existing_product_ids = split_closet_batch_writes(documents, upserted_ids, write_errors)
+    existing_ids = {}
+    if existing_product_ids:
+        with span("mongo-closet"):
+            existing = await closets_collection.find(
+                {"user_id": user_id, "original_product_id": {"$in": existing_product_ids}}, {"original_product_id": 1}
+            ).to_list()
+            existing_ids = {item["original_product_id"]: item["_id"] for item in existing}
+    invalidate_closet_summary(user_id)
+    return record_closet_batch_writes(results, documents, positions, upserted_ids, existing_ids, failed)
+
+
+async def get_all_closet_items_async(limit=None, projection=None, user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.get_all_closet_items
+
+    Args:
+        limit (int, optional): Limit the number of results returned
+        projection (dict, optional): Fields to fetch (defaults to whole documents)
+        user_id (str): Owner of the closet
+
+    Returns:
+        list: Closet items, oldest first
+    """
+    try:
+        cursor = get_async_db()["closets"].find({"user_id": user_id}, projection).sort(CLOSET_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        with span("mongo-closet"):
+            return await cursor.to_list()
+    except Exception as e:
+        logger.error(f"Error retrieving closet items: {e}")
+        return []
+
+
+async def get_closet_items_page_async(page_size=DEFAULT_CLOSET_PAGE_SIZE, cursor=None, projection=CLOSET_ITEM_PROJECTION, include_count=False, user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.get_closet_items_page
+
+    The page query and the optional count run concurrently.
+
+    Args:
+        page_size (int): Number of items per page (capped at MAX_CLOSET_PAGE_SIZE)
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        projection (dict, optional): Fields to fetch (defaults to the closet item response fields)
+        include_count (bool): Also count the user's closet items
+        user_id (str): Owner of the closet
+
+    Returns:
+        dict: "items", "next_cursor" (None on the last page) and, when
+            requested, "total_count"
+    """
+    closets_collection = get_async_db()["closets"]
+    mongo_filter, limit = plan_closet_page(user_id, page_size, cursor)
+
+    async def fetch_items():
+        with span("mongo-closet"):
+            find_cursor = closets_collection.find(mongo_filter, closet_page_projection(projection))
+            return await find_cursor.sort(CLOSET_SORT).limit(limit).to_list()
+
+    async def count_items():
+        with span("mongo-count"):
+            return await closets_collection.count_documents({"user_id": user_id})
+
+    if include_count:
+        items, total_count = await asyncio.gather(fetch_items(), count_items())
+    else:
+        items = await fetch_items()
+    page = make_closet_page(items, page_size)
+    if include_count:
+        page["total_count"] = total_count
+    return page
+
+
+async def get_closet_summary_async(user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.get_closet_summary, without printing
+
+    Args:
+        user_id (str): Owner of the closet
+
+    Returns:
+        dict: Summary from format_closet_summary
+    """
+    summary = closet_summary_cache.get(user_id)
+    if summary is None:
+        generation = closet_summary_cache.generation
+        with span("mongo-closet-summary"):
+            cursor = await get_async_db()["closets"].aggregate(closet_summary_pipeline(user_id))
+            results = await cursor.to_list()
+        summary = format_closet_summary(results[0] if results else {})
+        closet_summary_cache.set(user_id, summary, generation=generation)
+    return summary
+
+
+async def clear_closets_collection_async(user_id=None):
+    """
+    Async version of mongo_search.clear_closets_collection
+
+    Args:
+        user_id (str, optional): Only clear this user's closet (default: every user's)
+
+    Returns:
+        dict: Result of the clear operation
+    """
+    try:
+        db = get_async_db()
+        closets_collection = db["closets"]
+        if user_id is None:
+            deleted_count = await closets_collection.estimated_document_count()
+            with span("mongo-delete"):
+                await db.drop_collection("closets")
+            await ensure_closet_indexes_async()
+        else:
+            deleted_count = 0
+            while True:
+                with span("mongo-delete"):
+                    cursor = closets_collection.find(closet_owner_filter(user_id), {"_id": 1}).limit(CLOSET_CLEAR_BATCH_SIZE)
+                    ids = [item["_id"] for item in await cursor.to_list()]
+                    if ids:
+                        deleted_count += (await closets_collection.delete_many({"_id": {"$in": ids}})).deleted_count
+                if len(ids) < CLOSET_CLEAR_BATCH_SIZE:
+                    break
+        invalidate_closet_summary(user_id)
+        logger.info(f"Cleared {deleted_count} closet items" + (f" of '{user_id}'" if user_id is not None else ""))
+        return {
+            "success": True,
+            "message": "Successfully cleared closets collection",
+            "deleted_count": deleted_count
+        }
+    except Exception as e:
+        error_msg = f"Error clearing closets collection: {e}"
+        logger.error(error_msg)
+        return {
+            "success": False,
+            "message": error_msg,
+            "deleted_count": 0
+        }
+
+
+def start_closet_clear(user_id=None):
+    """
+    Clear closets in a background task instead of within a request
+
+    Args:
+        user_id (str, optional): Only clear this user's closet (default: every user's)
+
+    Returns:
+        bool: True if a clear was started, False if one for user_id is still running
+    """
+    task = _closet_clears.get(user_id)
+    if task is not None and not task.done():
+        return False
+    task = asyncio.create_task(clear_closets_collection_async(user_id), name="closet-clear")
+    _closet_clears[user_id] = task
+    task.add_done_callback(lambda done: _closet_clears.pop(user_id, None) if _closet_clears.get(user_id) is done else None)
+    return True
+
+
+async def wait_for_closet_clears():
+    """Wait for background closet clears to finish (before closing the client)"""
+    if _closet_clears:
+        await asyncio.gather(*_closet_clears.values(), return_exceptions=True)
+
+
+async def get_outfit_suggestions_with_llm_async(user_query, user_id=DEFAULT_USER_ID):
+    """
+    Async version of mongo_search.get_outfit_suggestions_with_llm
+
+    The Gemini call goes through the shared client's asyncio interface, so
+    waiting for the model holds no threadpool thread. The answer cache's
+    SQLite tier is read and written in a worker thread.
+
+    Args:
+        user_query (str): Natural language query about the occasion or outfit preference
+        user_id (str): Owner of the closet to pick items from
+
+    Returns:
+        dict: Outfit suggestions with LLM-generated explanation and suggested items
+    """
+    try:
+        closet_items = await get_all_closet_items_async(projection=OUTFIT_CLOSET_PROJECTION, user_id=user_id)
+        if not closet_items:
+            return outfit_error("No items found in closet")
+
+        cache_key = outfit_cache_key(user_query, closet_items)
+        with span("outfit-cache"):
+            answer = await asyncio.to_thread(outfit_response_cache.get, cache_key)
+        if answer is None:
+            if not os.getenv("GOOGLE_API_KEY"):
+                return outfit_error("Google API key not configured")
+            with span("gemini"):
+                response = await get_async_genai_client().models.generate_content(
+                    model=OUTFIT_SUGGESTION_MODEL,
+                    contents=[build_outfit_prompt(user_query, closet_items)]
+                )
+            answer = parse_outfit_answer(response)
+            if answer is None:
+                return outfit_error("Failed to generate outfit suggestions from LLM")
+            await asyncio.to_thread(outfit_response_cache.set, cache_key, answer)
+        return make_outfit_result(answer, user_query, closet_items)
+    except Exception as e:
+        logger.error(f"Error generating outfit suggestions: {e}")
+        return outfit_error(f"Error generating outfit suggestions: {str(e)}")
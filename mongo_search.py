@@ -1,13 +1,30 @@
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from dotenv import load_dotenv
-import ssl
-import certifi
+from bson import ObjectId
+from query_parser import parse_query, normalize_product_fields, tokenize
+from cache import TTLCache
+from timing import span
+from serializers import PRODUCT_PROJECTION, CLOSET_ITEM_PROJECTION, serialize_closet_item
+from llm_client import get_genai_client
+from llm_cache import ResponseCache
 
 # Load environment variables from .env file
 load_dotenv()
 
 import os
+import json
+import base64
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
 
 DB_USERNAME = os.getenv("MONGO_USERNAME",)  # Your MongoDB Atlas username
 DB_PASSWORD = os.getenv("MONGO_PASSWORD")
@@ -16,130 +33,575 @@ DB_NAME = os.getenv("MONGO_DBNAME")
 # Construct connection string
 uri = f"mongodb+srv://{DB_USERNAME}:{DB_PASSWORD}@{MONGO_CLUSTER}.mongodb.net/?retryWrites=true&w=majority&appName=Fashion"
 
-# Create a new client and connect to the server with proper SSL configuration
-# This fixes SSL certificate verification issues on macOS
-client = MongoClient(
-    uri, 
-    server_api=ServerApi('1')
+# Connection pool settings (see client_options)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None  # 0 = no timeout
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"
+
+_client = None
+_client_lock = threading.Lock()
+
+def client_options():
+    """
+    Keyword arguments shared by the sync and async MongoDB clients
+
+    Returns:
+        dict: Stable API version, pool sizes, timeouts and wire compression
+    """
+    options = {
+        "server_api": ServerApi('1'),
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+def get_client():
+    """
+    Shared MongoClient, created on first use
+
+    Creating the client does no I/O; connections are opened in the background
+    and on the first operation, so importing this module never blocks.
+
+    Returns:
+        MongoClient: The process-wide client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(uri, **client_options())
+    return _client
+
+def get_db():
+    """
+    Database handle on the shared client
+
+    Returns:
+        Database: The configured database
+    """
+    return get_client().get_database(DB_NAME)
+
+def ping():
+    """
+    Round-trip a ping to the deployment
+
+    Returns:
+        float: Round-trip time in milliseconds
+
+    Raises:
+        PyMongoError: If no server is reachable within the selection timeout
+    """
+    started = time.perf_counter()
+    get_client().admin.command('ping')
+    return (time.perf_counter() - started) * 1000
+
+# Indexes backing the normalized search fields (see backfill_normalized_fields).
+# Every search index ends in the page sort key, (_id) or (price_value, _id), so
+# keyset pages come back in index order; $in on colors/categories/sizes merges index ranges.
+PRODUCT_INDEXES = [
+    ([("color_norm", ASCENDING), ("_id", ASCENDING)], "color_norm_id"),
+    ([("category_norm", ASCENDING), ("color_norm", ASCENDING), ("_id", ASCENDING)], "category_norm_color_norm_id"),
+    ([("size_norm", ASCENDING), ("_id", ASCENDING)], "size_norm_id"),
+    ([("category_norm", ASCENDING), ("size_norm", ASCENDING), ("_id", ASCENDING)], "category_norm_size_norm_id"),
+    ([("title_tokens", ASCENDING), ("_id", ASCENDING)], "title_tokens_id"),
+    ([("color_norm", ASCENDING), ("price_value", ASCENDING), ("_id", ASCENDING)], "color_norm_price_value_id"),
+    ([("category_norm", ASCENDING), ("price_value", ASCENDING), ("_id", ASCENDING)], "category_norm_price_value_id"),
+    ([("price_value", ASCENDING), ("_id", ASCENDING)], "price_value_id"),
+    # Edits picked up by the poll-mode refresh of search_index.ProductSearchIndex
+    ([("updated_at", ASCENDING)], "updated_at"),
+]
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+MAX_BATCH_QUERIES = 20
+MAX_FACET_VALUES = 20
+DEFAULT_CLOSET_PAGE_SIZE = 50
+MAX_CLOSET_PAGE_SIZE = 500
+MAX_CLOSET_BATCH_SIZE = 100
+
+# Closets are partitioned by user; requests without a user share this one
+DEFAULT_USER_ID = os.getenv("DEFAULT_CLOSET_USER_ID", "anonymous")
+
+# Closet items carry expires_at = created_at + this TTL and are reaped by a
+# MongoDB TTL index; re-adding a product renews it. 0 keeps items forever
+CLOSET_ITEM_TTL_SECONDS = int(os.getenv("CLOSET_ITEM_TTL_SECONDS", str(30 * 24 * 3600)))
+# Items removed per round trip when clearing one user's closet
+CLOSET_CLEAR_BATCH_SIZE = 1000
+
+# Every closet query filters on user_id and reads in created_at order; a
+# product is in a user's closet at most once (items without a product are exempt)
+CLOSET_INDEXES = [
+    ([("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], "user_id_created_at_id", {}),
+    ([("user_id", ASCENDING), ("original_product_id", ASCENDING)], "user_id_original_product_id",
+     {"unique": True, "partialFilterExpression": {"original_product_id": {"$exists": True}}}),
+    # TTL index: MongoDB deletes items once expires_at has passed (items without it never expire)
+    ([("expires_at", ASCENDING)], "expires_at_ttl", {"expireAfterSeconds": 0}),
+]
+DUPLICATE_KEY_ERROR = 11000
+CLOSET_SORT = [("created_at", ASCENDING), ("_id", ASCENDING)]
+
+# Result cache for product searches, keyed on the normalized parse output
+# so "Blue Shirts" and "shirts blue" share an entry
+product_search_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_SEARCH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PRODUCT_SEARCH_CACHE_TTL_SECONDS", "60"))
 )
 
+# Catalog-wide color/category distributions change slowly, so they live longer
+product_facets_cache = TTLCache(
+    maxsize=1,
+    ttl=float(os.getenv("PRODUCT_FACETS_CACHE_TTL_SECONDS", "600"))
+)
 
-try:
-    client.admin.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
+# Per-user closet summaries. Closet writes in this process drop the owner's
+# entry; the TTL bounds how stale writes from other workers (and TTL expiry) leave it
+closet_summary_cache = TTLCache(
+    maxsize=int(os.getenv("CLOSET_SUMMARY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CLOSET_SUMMARY_CACHE_TTL_SECONDS", "30"))
+)
+CLOSET_SUMMARY_RECENT_ITEMS = 5
 
-# Get database reference
-db = client.get_database(DB_NAME)  # Actual database name
+def invalidate_closet_summary(user_id=None):
+    """
+    Drop the cached closet summary of a user after a write to their closet
 
-def query_products(natural_language_query):
+    Args:
+        user_id (str, optional): Owner of the closet (default: every user's summary)
     """
-    Query the products collection using natural language input
+    closet_summary_cache.invalidate(user_id)
+
+def invalidate_product_search_cache():
+    """
+    Drop all cached product search results and facet counts
+
+    Call after any write to the products collection so searches see it
+    immediately instead of after the cache TTL.
+    """
+    product_search_cache.invalidate()
+    product_facets_cache.invalidate()
+
+def encode_search_cursor(source, sort_value, last_id):
+    """
+    Encode the position after the last returned product as an opaque cursor
 
     Args:
-        natural_language_query (str): Natural language query like "blue shirts" or "red t-shirts"
+        source (str): "mongo" or "index", the engine that produced the page
+        sort_value: Sort key of the last product (None when sorting on _id alone)
+        last_id: _id of the last product
 
     Returns:
-        list: List of matching product documents (MAX 10)
+        str: URL-safe cursor string
+    """
+    payload = json.dumps({"s": source, "k": sort_value, "id": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor):
+    """
+    Decode a cursor produced by encode_search_cursor
+
+    Args:
+        cursor (str): Opaque cursor from a previous search response
+
+    Returns:
+        dict: source, sort_value and last_id (ObjectId)
+
+    Raises:
+        ValueError: If the cursor is malformed
     """
     try:
-        products_collection = db["products"]
-
-        # Parse the natural language query
-        query_lower = natural_language_query.lower().strip()
-
-        # Extract color and category/subcategory from the query
-        query_parts = query_lower.split()
-
-        # Common colors mapping
-        color_keywords = {
-            'blue': ['blue', 'navy', 'dark blue', 'light blue'],
-            'red': ['red', 'maroon', 'crimson', 'cherry'],
-            'green': ['green', 'olive', 'forest green', 'lime'],
-            'black': ['black', 'dark'],
-            'white': ['white', 'cream', 'off-white'],
-            'grey': ['grey', 'gray', 'charcoal'],
-            'yellow': ['yellow', 'golden'],
-            'pink': ['pink', 'rose'],
-            'brown': ['brown', 'tan', 'beige'],
-            'purple': ['purple', 'violet'],
-            'orange': ['orange'],
-            'multi': ['multi', 'multicolor', 'printed', 'pattern']
-        }
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return {"source": payload["s"], "sort_value": payload["k"], "last_id": ObjectId(payload["id"])}
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
 
-        # Category/subcategory mapping
-        category_mapping = {
-            'shirt': 'Shirts',
-            'shirts': 'Shirts',
-            't-shirt': 'T-shirts & Polos',
-            'tshirt': 'T-shirts & Polos',
-            't-shirts': 'T-shirts & Polos',
-            'tshirts': 'T-shirts & Polos',
-            'polo': 'T-shirts & Polos',
-            'polos': 'T-shirts & Polos',
-            'jeans': 'Jeans',
-            'pants': 'Trousers & Chinos',
-            'trousers': 'Trousers & Chinos',
-            'chinos': 'Trousers & Chinos',
-            'shorts': 'Shorts',
-            'jacket': 'Jackets & Coats',
-            'jackets': 'Jackets & Coats',
-            'sweater': 'Sweaters',
-            'sweaters': 'Sweaters',
-            'hoodie': 'Hoodies & Sweatshirts',
-            'hoodies': 'Hoodies & Sweatshirts'
-        }
+def build_product_filter(parsed):
+    """
+    Build an index-covered MongoDB filter from a parsed query
 
-        # Build MongoDB query
-        mongo_query = {"$and": []}
-
-        # Find color in query
-        detected_color = None
-        for color, variations in color_keywords.items():
-            if any(variation in query_lower for variation in variations):
-                detected_color = color
-                break
-
-        # Find category in query
-        detected_category = None
-        for keyword, subcategory in category_mapping.items():
-            if keyword in query_lower:
-                detected_category = subcategory
-                break
-
-        # Build query filters
-        if detected_color:
-            # Search in product_color field (case insensitive)
-            color_filter = {
-                "$or": [
-                    {"product_color": {"$regex": detected_color, "$options": "i"}},
-                    {"product_title": {"$regex": detected_color, "$options": "i"}}
-                ]
-            }
-            mongo_query["$and"].append(color_filter)
-
-        if detected_category:
-            # Search in product_category field
-            category_filter = {"product_category": {"$regex": detected_category, "$options": "i"}}
-            mongo_query["$and"].append(category_filter)
-
-        # If no specific filters found, do a text search
-        if not mongo_query["$and"]:
-            mongo_query = {
-                "$or": [
-                    {"product_title": {"$regex": query_lower, "$options": "i"}},
-                    {"product_color": {"$regex": query_lower, "$options": "i"}},
-                    {"product_category": {"$regex": query_lower, "$options": "i"}}
-                ]
-            }
+    Args:
+        parsed (ParsedQuery): Output of query_parser.parse_query
+
+    Returns:
+        dict: Exact-match/$in filters on the normalized fields and a price_value range
+    """
+    mongo_query = {}
+
+    if parsed.colors:
+        colors = list(parsed.colors)
+        mongo_query["color_norm"] = colors[0] if len(colors) == 1 else {"$in": colors}
+
+    if parsed.categories:
+        categories = [category.lower() for category in parsed.categories]
+        mongo_query["category_norm"] = categories[0] if len(categories) == 1 else {"$in": categories}
+
+    if parsed.sizes:
+        mongo_query["size_norm"] = {"$in": list(parsed.sizes)}
+
+    price_range = {}
+    if parsed.min_price is not None:
+        price_range["$gte"] = parsed.min_price
+    if parsed.max_price is not None:
+        price_range["$lte"] = parsed.max_price
+    if price_range:
+        mongo_query["price_value"] = price_range
+
+    # If no specific filters found, match on title words
+    if not mongo_query and parsed.tokens:
+        mongo_query["title_tokens"] = {"$all": list(parsed.tokens)}
+
+    return mongo_query
+
+def product_sort_field(parsed):
+    """
+    Pick the keyset sort key for a parsed query
+
+    Price-bounded queries page cheapest first on (price_value, _id) so the
+    price range and the sort share one index; everything else pages on _id.
+
+    Args:
+        parsed (ParsedQuery): Output of query_parser.parse_query
+
+    Returns:
+        str: "price_value" or "_id"
+    """
+    if parsed.min_price is not None or parsed.max_price is not None:
+        return "price_value"
+    return "_id"
+
+def facet_stages():
+    """
+    $facet branches that count matching products per color and category
+
+    Returns:
+        dict: "colors" and "categories" sub-pipelines ({"_id": value, "count": n} buckets)
+    """
+    return {
+        "colors": [{"$unwind": "$color_norm"}, {"$sortByCount": "$color_norm"}, {"$limit": MAX_FACET_VALUES}],
+        "categories": [{"$match": {"category_norm": {"$ne": None}}}, {"$sortByCount": "$category_norm"}, {"$limit": MAX_FACET_VALUES}],
+    }
+
+def format_facets(result):
+    """
+    Turn $facet count branches into response lists
+
+    Args:
+        result (dict): Aggregation output holding "colors"/"categories" buckets
+
+    Returns:
+        dict: "colors" and "categories" lists of {"value", "count"}
+    """
+    return {
+        name: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in result.get(name, [])]
+        for name in ("colors", "categories")
+    }
+
+def closet_summary_pipeline(user_id, recent=CLOSET_SUMMARY_RECENT_ITEMS):
+    """
+    One aggregation counting a closet's items by type, category and color and
+    fetching its newest items
+
+    Args:
+        user_id (str): Owner of the closet
+        recent (int): Number of newest items to return
+
+    Returns:
+        list: Pipeline producing one document with "total", "types",
+            "categories", "colors" and "recent"
+    """
+    # Legacy items keep category and color under their old field names
+    category = {"$ifNull": ["$product_category", {"$ifNull": ["$category", "N/A"]}]}
+    color = {"$ifNull": ["$product_color", {"$ifNull": ["$colors.primary", "N/A"]}]}
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "types": [{"$sortByCount": {"$ifNull": ["$type", "N/A"]}}],
+            "categories": [{"$sortByCount": category}, {"$limit": MAX_FACET_VALUES}],
+            "colors": [{"$sortByCount": color}, {"$limit": MAX_FACET_VALUES}],
+            "recent": [{"$sort": {"created_at": -1, "_id": -1}}, {"$limit": recent}, {"$project": CLOSET_ITEM_PROJECTION}],
+        }},
+    ]
+
+def format_closet_summary(result):
+    """
+    Turn the closet_summary_pipeline output into the summary response
+
+    Args:
+        result (dict): The pipeline's single output document (empty if none)
+
+    Returns:
+        dict: total_items, type_counts, category_counts and color_counts
+            (lists of {"value", "count"}, most common first) and recent_items
+    """
+    total = result.get("total")
+    counts = {
+        name: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in result.get(source, [])]
+        for name, source in (("type_counts", "types"), ("category_counts", "categories"), ("color_counts", "colors"))
+    }
+    return {
+        "total_items": total[0]["count"] if total else 0,
+        **counts,
+        "recent_items": [serialize_closet_item(item) for item in result.get("recent", [])],
+    }
+
+def get_global_facets():
+    """
+    Color and category counts over the whole catalog, cached
+
+    Returns:
+        dict: "colors" and "categories" lists of {"value", "count"}, most common first
+    """
+    facets = product_facets_cache.get("global")
+    if facets is None:
+        generation = product_facets_cache.generation
+        with span("mongo-facets"):
+            result = next(get_db()["products"].aggregate([{"$facet": facet_stages()}]), {})
+        facets = format_facets(result)
+        product_facets_cache.set("global", facets, generation=generation)
+    return facets
+
+def search_cache_key(parsed, page_size, cursor=None, facets=False):
+    """
+    Cache key for one search page
+
+    Args:
+        parsed (ParsedQuery): Output of query_parser.parse_query
+        page_size (int): Number of products per page
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        facets (bool): Whether the page carries facet counts
+
+    Returns:
+        tuple: Hashable key for product_search_cache
+    """
+    return (parsed.cache_key, page_size, (cursor["sort_value"], cursor["last_id"]) if cursor else None, facets)
+
+def plan_search_page(parsed, page_size, cursor=None, facets=False):
+    """
+    Build the MongoDB operation for one search page without running it
 
-        print(f"Searching for: '{natural_language_query}'")
-        print(f"Detected - Color: {detected_color}, Category: {detected_category}")
+    Shared by search_products_page and its async twin in mongo_async.py.
 
-        # Execute the query with limit of 10
-        cursor = products_collection.find(mongo_query).limit(10)
-        results = list(cursor)
+    Args:
+        parsed (ParsedQuery): Output of query_parser.parse_query
+        page_size (int): Number of products per page
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        facets (bool): Also count matches per color and category
+
+    Returns:
+        dict: "sort_field" plus either "pipeline" (one $facet aggregation for the
+            hits and the facet counts) or "filter", "projection", "sort" and
+            "limit" for find()
+    """
+    # Build MongoDB query on the indexed normalized fields
+    base_query = build_product_filter(parsed)
+    sort_field = product_sort_field(parsed)
+    mongo_query = dict(base_query)
+    if cursor and sort_field == "_id":
+        mongo_query["_id"] = {"$gt": cursor["last_id"]}
+    elif cursor:
+        mongo_query = {"$and": [mongo_query, {"$or": [
+            {sort_field: {"$gt": cursor["sort_value"]}},
+            {sort_field: cursor["sort_value"], "_id": {"$gt": cursor["last_id"]}}
+        ]}]}
+
+    # Fetch one extra product to know whether another page exists
+    sort = [(sort_field, ASCENDING), ("_id", ASCENDING)] if sort_field != "_id" else [("_id", ASCENDING)]
+    cursor_projection = {**PRODUCT_PROJECTION, sort_field: 1}
+    if facets and base_query:
+        # Counts cover every match, so the keyset condition only applies to the hits branch
+        hits_stages = [{"$match": mongo_query}] if mongo_query != base_query else []
+        hits_stages += [{"$sort": dict(sort)}, {"$limit": page_size + 1}, {"$project": cursor_projection}]
+        return {"sort_field": sort_field, "pipeline": [
+            {"$match": base_query},
+            {"$facet": {"hits": hits_stages, **facet_stages()}},
+        ]}
+    return {"sort_field": sort_field, "filter": mongo_query, "projection": cursor_projection, "sort": sort, "limit": page_size + 1}
+
+def search_products_page(natural_language_query, page_size=DEFAULT_PAGE_SIZE, cursor=None, facets=False):
+    """
+    Fetch one keyset-paginated page of products for a natural language query
+
+    Pages are ordered by (sort key, _id) and continue strictly after the last
+    product of the previous page, so every page costs the same index range
+    scan no matter how deep it is. With facets, the page and the color and
+    category counts over all matches come from one $facet aggregation.
+
+    Args:
+        natural_language_query (str): Natural language query like "blue shirts"
+        page_size (int): Number of products per page (capped at MAX_PAGE_SIZE)
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        facets (bool): Also count matches per color and category
+
+    Returns:
+        dict: "products" for this page, "next_cursor" (None on the last page)
+            and, when requested, "facets"
+    """
+    products_collection = get_db()["products"]
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    # Parse the natural language query in a single pass
+    parsed = parse_query(natural_language_query)
+
+    cache_key = search_cache_key(parsed, page_size, cursor, facets)
+    cached_page = product_search_cache.get(cache_key)
+    if cached_page is not None:
+        return cached_page
+    generation = product_search_cache.generation
+
+    # Arguments rather than an f-string: nothing is formatted unless debug logging is on
+    logger.debug("Searching for %r - Colors: %s, Categories: %s, Sizes: %s, Price: %s-%s", natural_language_query,
+                 parsed.colors, parsed.categories, parsed.sizes, parsed.min_price, parsed.max_price)
+
+    plan = plan_search_page(parsed, page_size, cursor, facets)
+    if "pipeline" in plan:
+        with span("mongo-search"):
+            result = next(products_collection.aggregate(plan["pipeline"]), {})
+        results = result.get("hits", [])
+        facet_counts = format_facets(result)
+    else:
+        with span("mongo-search"):
+            results = list(products_collection.find(plan["filter"], plan["projection"]).sort(plan["sort"]).limit(plan["limit"]))
+        # An unfiltered query matches the whole catalog
+        facet_counts = get_global_facets() if facets else None
+
+    page = make_search_page(results, page_size, plan["sort_field"])
+    if facets:
+        page["facets"] = facet_counts
+    product_search_cache.set(cache_key, page, generation=generation)
+    return page
+
+def make_search_page(results, page_size, sort_field):
+    """
+    Trim fetched products to a page and encode the cursor for the next one
+
+    Args:
+        results (list): Up to page_size + 1 products; the extra one only signals another page
+        page_size (int): Number of products per page
+        sort_field (str): Keyset sort key from product_sort_field
+
+    Returns:
+        dict: "products" and "next_cursor" (None on the last page)
+    """
+    next_cursor = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        last = results[-1]
+        next_cursor = encode_search_cursor("mongo", last.get(sort_field) if sort_field != "_id" else None, last["_id"])
+    return {"products": results, "next_cursor": next_cursor}
+
+def plan_search_batch(pending, page_size):
+    """
+    Build the single aggregation that answers several searches
+
+    An index-backed top-level $match takes the union of the filters, then
+    one $facet branch per search re-applies its own filter, sort and limit.
+
+    Args:
+        pending (list): (cache key, ParsedQuery) pairs still to be fetched
+        page_size (int): Number of products per page
+
+    Returns:
+        tuple: (pipeline, branches) where branches maps each $facet branch
+            name to its (cache key, sort field)
+    """
+    filters = []
+    facets = {}
+    branches = {}
+    for branch, (key, parsed) in enumerate(pending):
+        mongo_query = build_product_filter(parsed)
+        sort_field = product_sort_field(parsed)
+        sort = {sort_field: ASCENDING, "_id": ASCENDING} if sort_field != "_id" else {"_id": ASCENDING}
+        filters.append(mongo_query)
+        branches[str(branch)] = (key, sort_field)
+        # Project last: each branch still needs the normalized fields to re-apply its filter
+        facets[str(branch)] = [
+            {"$match": mongo_query},
+            {"$sort": sort},
+            {"$limit": page_size + 1},
+            {"$project": {**PRODUCT_PROJECTION, sort_field: 1}},
+        ]
+    pipeline = [
+        {"$match": filters[0] if len(filters) == 1 else {"$or": filters}},
+        {"$facet": facets},
+    ]
+    return pipeline, branches
+
+def _dedupe_batch(natural_language_queries, page_size):
+    # Dedupe on the normalized parse so "Blue Shirts" and "shirts blue" share one branch
+    parsed_by_key = {}
+    query_keys = []
+    for natural_language_query in natural_language_queries:
+        parsed = parse_query(natural_language_query)
+        key = search_cache_key(parsed, page_size)
+        parsed_by_key.setdefault(key, parsed)
+        query_keys.append(key)
+
+    pages = {}
+    pending = []
+    for key, parsed in parsed_by_key.items():
+        cached_page = product_search_cache.get(key)
+        if cached_page is not None:
+            pages[key] = cached_page
+        else:
+            pending.append((key, parsed))
+    return query_keys, pages, pending
+
+def search_products_batch(natural_language_queries, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetch the first page for several queries in one MongoDB round trip
+
+    Queries that parse to the same filters are answered once, cached pages
+    are reused, and the rest run as a single aggregation (see
+    plan_search_batch). Pages are cached under the same keys as
+    search_products_page, so following a batch result's next_cursor
+    continues normally.
+
+    Args:
+        natural_language_queries (list): Queries like ["blue shirts", "jeans under $40"]
+        page_size (int): Number of products per page (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        list: One {"products", "next_cursor"} page per input query, in input order
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    query_keys, pages, pending = _dedupe_batch(natural_language_queries, page_size)
+
+    if pending:
+        generation = product_search_cache.generation
+        pipeline, branches = plan_search_batch(pending, page_size)
+        logger.debug("Batch searching %d queries (%d requested)", len(pending), len(natural_language_queries))
+        with span("mongo-batch"):
+            results = next(get_db()["products"].aggregate(pipeline), {})
+        for branch, (key, sort_field) in branches.items():
+            page = make_search_page(results.get(branch, []), page_size, sort_field)
+            product_search_cache.set(key, page, generation=generation)
+            pages[key] = page
+
+    return [pages[key] for key in query_keys]
+
+def query_products(natural_language_query):
+    """
+    Query the products collection using natural language input
+
+    Args:
+        natural_language_query (str): Natural language query like "blue shirts" or "red t-shirts"
+
+    Returns:
+        list: List of matching product documents (MAX 10)
+    """
+    try:
+        results = search_products_page(natural_language_query)["products"]
 
         print(f"Found {len(results)} products matching the query")
 
@@ -162,7 +624,7 @@ def inspect_products_schema():
     Inspect the actual structure of products in the database
     """
     try:
-        products_collection = db["products"]
+        products_collection = get_db()["products"]
         sample_product = products_collection.find_one()
         
         if sample_product:
@@ -178,38 +640,231 @@ def inspect_products_schema():
         print(f"Error inspecting products schema: {e}")
         return None
 
-def get_product_by_id(product_id):
+def get_product_by_id(product_id, projection=PRODUCT_PROJECTION):
     """
     Get a product from the products collection by its _id
     
     Args:
         product_id (str): The MongoDB _id of the product
+        projection (dict, optional): Fields to fetch (defaults to the product response fields)
         
     Returns:
         dict: Product document or None if not found
     """
     try:
         from bson import ObjectId
-        products_collection = db["products"]
+        products_collection = get_db()["products"]
         
         # Convert string ID to ObjectId
         object_id = ObjectId(product_id)
-        product = products_collection.find_one({"_id": object_id})
+        product = products_collection.find_one({"_id": object_id}, projection)
         
         return product
     except Exception as e:
         print(f"Error getting product by ID: {e}")
         return None
 
-def add_product_to_closet(product_id):
+def get_title_vocabulary(min_count=1):
+    """
+    Count how many products use each title word
+
+    Args:
+        min_count (int): Drop words used by fewer products
+
+    Returns:
+        dict: title token -> number of products whose title contains it
     """
-    Add a product from the products collection to the closets collection
+    pipeline = [
+        {"$project": {"_id": 0, "title_tokens": 1}},
+        {"$unwind": "$title_tokens"},
+        {"$group": {"_id": "$title_tokens", "count": {"$sum": 1}}},
+    ]
+    if min_count > 1:
+        pipeline.append({"$match": {"count": {"$gte": min_count}}})
+    return {row["_id"]: row["count"] for row in get_db()["products"].aggregate(pipeline, allowDiskUse=True)}
+
+def get_products_by_ids(product_ids, projection=PRODUCT_PROJECTION):
+    """
+    Fetch several products in one round trip, preserving the given order
+
+    Args:
+        product_ids (list): Product _ids as strings
+        projection (dict, optional): Fields to fetch (defaults to the product response fields)
+
+    Returns:
+        list: Product documents in product_ids order (missing ids are skipped)
+    """
+    object_ids = [ObjectId(product_id) for product_id in product_ids]
+    with span("mongo-products"):
+        products = {product["_id"]: product for product in get_db()["products"].find({"_id": {"$in": object_ids}}, projection)}
+    return [products[object_id] for object_id in object_ids if object_id in products]
+
+def closet_owner_filter(user_id=None):
+    """
+    Filter selecting one user's closet items, or every item
+
+    Args:
+        user_id (str, optional): Owner of the closet (None matches all users)
+
+    Returns:
+        dict: MongoDB filter
+    """
+    return {} if user_id is None else {"user_id": user_id}
+
+def closet_item_expiry(created_at):
+    """
+    Expiry time of a closet item
+
+    Args:
+        created_at (datetime): When the item was added
+
+    Returns:
+        datetime: created_at + CLOSET_ITEM_TTL_SECONDS, or None if items do not expire
+    """
+    if CLOSET_ITEM_TTL_SECONDS <= 0:
+        return None
+    return created_at + timedelta(seconds=CLOSET_ITEM_TTL_SECONDS)
+
+def ensure_closet_indexes():
+    """
+    Create the per-user closet indexes (run dedupe_closet_items first on old data)
+
+    Returns:
+        list: Names of the ensured indexes
+    """
+    closets_collection = get_db()["closets"]
+    names = []
+    for keys, name, options in CLOSET_INDEXES:
+        names.append(closets_collection.create_index(keys, name=name, **options))
+        print(f"Ensured index '{name}' on closets")
+    return names
+
+def dedupe_closet_items():
+    """
+    Keep only the oldest closet item per (user_id, original_product_id)
+
+    Needed once before the unique index can be built on closets filled
+    before adds were idempotent.
+
+    Returns:
+        int: Number of deleted duplicates
+    """
+    closets_collection = get_db()["closets"]
+    duplicates = closets_collection.aggregate([
+        {"$match": {"original_product_id": {"$exists": True}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "product": "$original_product_id"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+    extra_ids = [item_id for group in duplicates for item_id in group["ids"][1:]]
+    deleted = closets_collection.delete_many({"_id": {"$in": extra_ids}}).deleted_count if extra_ids else 0
+    print(f"✅ Removed {deleted} duplicate closet items")
+    return deleted
+
+def backfill_closet_owners():
+    """
+    Assign closet items saved before closets were per-user to the shared closet
+
+    created_at is taken from the _id timestamp where missing.
+
+    Returns:
+        int: Number of updated items
+    """
+    result = get_db()["closets"].update_many(
+        {"user_id": {"$exists": False}},
+        [{"$set": {"user_id": DEFAULT_USER_ID, "created_at": {"$ifNull": ["$created_at", {"$toDate": "$_id"}]}}}]
+    )
+    print(f"✅ Assigned {result.modified_count} closet items to '{DEFAULT_USER_ID}'")
+    return result.modified_count
+
+def backfill_closet_expiry():
+    """
+    Give closet items saved before the TTL index an expires_at of created_at + CLOSET_ITEM_TTL_SECONDS
+
+    Returns:
+        int: Number of updated items
+    """
+    if CLOSET_ITEM_TTL_SECONDS <= 0:
+        return 0
+    result = get_db()["closets"].update_many(
+        {"expires_at": {"$exists": False}, "created_at": {"$type": "date"}},
+        [{"$set": {"expires_at": {"$add": ["$created_at", CLOSET_ITEM_TTL_SECONDS * 1000]}}}]
+    )
+    print(f"✅ Set expires_at on {result.modified_count} closet items")
+    return result.modified_count
+
+def ensure_product_indexes():
+    """
+    Create the compound indexes used by query_products on the products collection
+
+    Returns:
+        list: Names of the ensured indexes
+    """
+    products_collection = get_db()["products"]
+    names = []
+    for keys, name in PRODUCT_INDEXES:
+        names.append(products_collection.create_index(keys, name=name))
+        print(f"Ensured index '{name}' on products")
+    return names
+
+def backfill_normalized_fields(batch_size=500):
+    """
+    Populate color_norm, category_norm, title_tokens, size_norm and the numeric
+    price_value on every product
+
+    Safe to re-run: each product's fields are recomputed from its current
+    title, color, category, size and price.
+
+    Args:
+        batch_size (int): Number of updates sent per bulk_write round trip
+
+    Returns:
+        dict: Result of the backfill with the number of updated products
+    """
+    try:
+        products_collection = get_db()["products"]
+        cursor = products_collection.find(
+            {},
+            {"product_title": 1, "product_color": 1, "product_category": 1, "product_size": 1, "product_price": 1}
+        ).batch_size(batch_size)
+
+        operations = []
+        scanned = 0
+        modified = 0
+        for product in cursor:
+            operations.append(UpdateOne({"_id": product["_id"]}, {"$set": normalize_product_fields(product)}))
+            scanned += 1
+            if len(operations) >= batch_size:
+                modified += products_collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+                print(f"Backfilled {scanned} products...")
+
+        if operations:
+            modified += products_collection.bulk_write(operations, ordered=False).modified_count
+
+        invalidate_product_search_cache()
+
+        print(f"✅ Backfill complete: {scanned} products scanned, {modified} updated")
+        return {"success": True, "scanned": scanned, "modified": modified}
+
+    except Exception as e:
+        error_msg = f"Error backfilling normalized fields: {e}"
+        print(f"❌ {error_msg}")
+        return {"success": False, "message": error_msg, "scanned": 0, "modified": 0}
+
+def add_product_to_closet(product_id, user_id=DEFAULT_USER_ID):
+    """
+    Add a product from the products collection to a user's closet
+
+    Idempotent: adding a product that is already in the closet returns the
+    existing item's ID instead of inserting a duplicate.
     
     Args:
         product_id (str): The MongoDB _id of the product to add
+        user_id (str): Owner of the closet
         
     Returns:
-        str: The inserted document ID or None if failed
+        str: The closet item's document ID or None if failed
     """
     try:
         # Get the product from products collection
@@ -219,219 +874,504 @@ def add_product_to_closet(product_id):
             return None
             
         # Get or create the closets collection
-        closets_collection = db["closets"]
-        
-        # Create closet item from product data (new schema)
-        closet_item = {
-            "type": "product",
-            "original_product_id": str(product["_id"]),
-            "product_name": product.get("product_title", "N/A"),
-            "product_title": product.get("product_title", "N/A"),
-            "product_url": product.get("product_url", ""),
-            "image_url": product.get("image_url", ""),
-            "product_price": product.get("product_price", "N/A"),
-            "product_color": product.get("product_color", "N/A"),
-            "product_size": product.get("product_size", "N/A"),
-            "product_category": product.get("product_category", "N/A"),
-            # Legacy fields for backward compatibility
-            "colors": {"primary": product.get("product_color", ""), "secondary": ""},
-            "metadata": {"price": product.get("product_price", "N/A")},
-            "category": product.get("product_category", "N/A"),
-            "subcategory": product.get("product_category", "N/A")
-        }
+        closets_collection = get_db()["closets"]
+        closet_item = build_closet_item(product, user_id)
         
-        # Add unique closet item ID
-        import uuid
-        closet_item["closet_item_id"] = str(uuid.uuid4())
+        # Insert the document unless the product is already in this closet
+        try:
+            with span("mongo-insert"):
+                saved = closets_collection.find_one_and_update(
+                    closet_item_key(closet_item), closet_item_upsert(closet_item),
+                    projection={"_id": 1}, upsert=True, return_document=ReturnDocument.AFTER
+                )
+        except DuplicateKeyError:
+            # A concurrent add of the same product won the insert
+            saved = closets_collection.find_one(closet_item_key(closet_item), {"_id": 1})
         
-        # Insert the document
-        result = closets_collection.insert_one(closet_item)
-        
-        print(f"Successfully added product to closet with ID: {result.inserted_id}")
-        return str(result.inserted_id)
+        invalidate_closet_summary(user_id)
+        print(f"Product is in closet with ID: {saved['_id']}")
+        return str(saved["_id"])
         
     except Exception as e:
         print(f"Error adding product to closet: {e}")
         return None
 
-def add_to_closet(closet_item):
+def build_closet_item(product, user_id):
     """
-    Add a given item/row to the 'closets' collection in MongoDB
-    Creates the collection if it doesn't exist
+    Build the closets document for a product
+
+    Args:
+        product (dict): Product document from the products collection
+        user_id (str): Owner of the closet
+
+    Returns:
+        dict: Closet item in the new schema plus legacy fields, with a fresh closet_item_id
+    """
+    # Create closet item from product data (new schema)
+    created_at = datetime.now(timezone.utc)
+    closet_item = {
+        "user_id": user_id,
+        "created_at": created_at,
+        "type": "product",
+        "original_product_id": str(product["_id"]),
+        "product_name": product.get("product_title", "N/A"),
+        "product_title": product.get("product_title", "N/A"),
+        "product_url": product.get("product_url", ""),
+        "image_url": product.get("image_url", ""),
+        "product_price": product.get("product_price", "N/A"),
+        "product_color": product.get("product_color", "N/A"),
+        "product_size": product.get("product_size", "N/A"),
+        "product_category": product.get("product_category", "N/A"),
+        # Legacy fields for backward compatibility
+        "colors": {"primary": product.get("product_color", ""), "secondary": ""},
+        "metadata": {"price": product.get("product_price", "N/A")},
+        "category": product.get("product_category", "N/A"),
+        "subcategory": product.get("product_category", "N/A")
+    }
     
-    DEPRECATED: Use add_product_to_closet() for adding products by ID
+    expires_at = closet_item_expiry(created_at)
+    if expires_at is not None:
+        closet_item["expires_at"] = expires_at
+
+    # Add unique closet item ID
+    closet_item["closet_item_id"] = str(uuid.uuid4())
+    return closet_item
+
+def closet_item_key(closet_item):
+    """
+    Filter matching the closet item for the same product and owner
 
     Args:
-        closet_item (dict): The item data to add to closets collection
+        closet_item (dict): Closet item from build_closet_item
 
     Returns:
-        str: The inserted document ID or None if failed
+        dict: Equality filter on the unique (user_id, original_product_id) index
     """
-    try:
-        # Get or create the closets collection
-        closets_collection = db["closets"]
+    return {"user_id": closet_item["user_id"], "original_product_id": closet_item["original_product_id"]}
 
-        # Check if collection exists, if not it will be created automatically on first insert
-        existing_collections = db.list_collection_names()
-        if "closets" not in existing_collections:
-            print("Creating new 'closets' collection...")
+def closet_item_upsert(closet_item):
+    """
+    Update inserting the closet item unless present; an existing item gets the new expiry
 
+    Args:
+        closet_item (dict): Closet item from build_closet_item
 
-        # Add an ID field if not provided for better tracking
-        if "closet_item_id" not in closet_item:
-            import uuid
-            closet_item["closet_item_id"] = str(uuid.uuid4())
+    Returns:
+        dict: Update document for an upsert on closet_item_key
+    """
+    if "expires_at" not in closet_item:
+        return {"$setOnInsert": closet_item}
+    fields = {name: value for name, value in closet_item.items() if name != "expires_at"}
+    return {"$setOnInsert": fields, "$set": {"expires_at": closet_item["expires_at"]}}
 
-        # Insert the document (this creates the collection if it doesn't exist)
-        result = closets_collection.insert_one(closet_item)
+def parse_product_ids(product_ids):
+    """
+    Convert product ID strings to ObjectIds, skipping malformed ones
 
-        print(f"Successfully added item to closet with ID: {result.inserted_id}")
-        print(f"Closet item ID: {closet_item.get('closet_item_id')}")
+    Args:
+        product_ids (list): Product _ids as strings
 
-        # Verify collection was created
-        updated_collections = db.list_collection_names()
-        if "closets" in updated_collections:
-            total_items = closets_collection.count_documents({})
-            print(f"Closets collection now has {total_items} items")
+    Returns:
+        dict: Product ID string -> ObjectId, for valid IDs only
+    """
+    return {product_id: ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(product_id)}
 
-        return str(result.inserted_id)
+def build_closet_batch(product_ids, object_ids, products, user_id):
+    """
+    Build the closet items for a batch add and pre-fill per-ID failures
 
-    except Exception as e:
-        print(f"Error adding item to closet: {e}")
-        return None
+    A product requested more than once is written once and shares its result.
 
-def get_all_closet_items(limit=None):
+    Args:
+        product_ids (list): Requested product IDs, in request order
+        object_ids (dict): Valid IDs from parse_product_ids
+        products (dict): ObjectId -> product document for the products found
+        user_id (str): Owner of the closet
+
+    Returns:
+        tuple: (results, documents, positions); results has one entry per
+            requested ID, documents are the closet items to upsert and
+            positions[i] lists the indexes in results of documents[i]
     """
-    Display all data entries from the 'closets' collection
+    results, documents, positions = [], [], []
+    document_index = {}
+    for product_id in product_ids:
+        object_id = object_ids.get(product_id)
+        if object_id is None:
+            results.append({"product_id": product_id, "success": False, "error": "Invalid product ID"})
+        elif object_id not in products:
+            results.append({"product_id": product_id, "success": False, "error": "Product not found"})
+        else:
+            if object_id not in document_index:
+                document_index[object_id] = len(documents)
+                documents.append(build_closet_item(products[object_id], user_id))
+                positions.append([])
+            positions[document_index[object_id]].append(len(results))
+            results.append({"product_id": product_id, "success": True, "mongodb_id": None, "created": False})
+    return results, documents, positions
+
+def closet_batch_upserts(documents):
+    """
+    Unordered bulk_write requests inserting each closet item unless already present
 
     Args:
-        limit (int, optional): Limit the number of results returned
+        documents (list): Closet items from build_closet_batch
 
     Returns:
-        list: List of all closet items
+        list: One upserting UpdateOne per document
     """
-    try:
-        closets_collection = db["closets"]
+    return [UpdateOne(closet_item_key(document), closet_item_upsert(document), upsert=True) for document in documents]
 
-        # Check if collection exists
-        existing_collections = db.list_collection_names()
-        if "closets" not in existing_collections:
-            print("❌ 'closets' collection doesn't exist yet")
-            return []
+def split_closet_batch_writes(documents, upserted_ids, write_errors=()):
+    """
+    Sort the outcome of a closet batch bulk_write
 
-        # Get total count
-        total_count = closets_collection.count_documents({})
+    Args:
+        documents (list): Closet items in request order of the bulk_write
+        upserted_ids (dict): Request index -> _id of the inserted items
+        write_errors (list): writeErrors of a BulkWriteError, if one was raised
 
-        if total_count == 0:
-            print("❌ No items found in closets collection")
-            return []
+    Returns:
+        tuple: (failed, existing_product_ids) where failed maps request index
+            to an error message and existing_product_ids are the products that
+            were already in the closet and need their _id looked up
+    """
+    failed = {}
+    for error in write_errors:
+        # Losing an insert race to a concurrent add still means the product is in the closet
+        if error.get("code") != DUPLICATE_KEY_ERROR:
+            failed[error["index"]] = error.get("errmsg", "Write failed")
+    existing_product_ids = [
+        document["original_product_id"] for index, document in enumerate(documents)
+        if index not in upserted_ids and index not in failed
+    ]
+    return failed, existing_product_ids
 
-        print(f"👕 Closets Collection Data")
-        print("=" * 60)
-        print(f"Total items: {total_count}")
-        print("-" * 60)
+def record_closet_batch_writes(results, documents, positions, upserted_ids, existing_ids, failed):
+    """
+    Fill in the outcome of a closet batch
 
-        # Execute query
-        if limit:
-            cursor = closets_collection.find({}).limit(limit)
-            print(f"Showing first {limit} items:")
+    Args:
+        results (list): Results from build_closet_batch
+        documents (list): Upserted closet items
+        positions (list): Result indexes of each document
+        upserted_ids (dict): Request index -> _id of the inserted items
+        existing_ids (dict): original_product_id -> _id of items already in the closet
+        failed (dict): Request index -> error message
+
+    Returns:
+        list: results, with mongodb_id and created for saved items and an error for failed ones
+    """
+    for index, document in enumerate(documents):
+        if index in upserted_ids:
+            outcome = {"success": True, "mongodb_id": str(upserted_ids[index]), "created": True}
+        elif document["original_product_id"] in existing_ids:
+            outcome = {"success": True, "mongodb_id": str(existing_ids[document["original_product_id"]]), "created": False}
         else:
-            cursor = closets_collection.find({})
-            print("Showing all items:")
+            outcome = {"success": False, "error": failed.get(index, "Write failed")}
+        for position in positions[index]:
+            results[position] = {"product_id": results[position]["product_id"], **outcome}
+    return results
 
-        results = list(cursor)
+def add_products_to_closet(product_ids, user_id=DEFAULT_USER_ID):
+    """
+    Add several products to a user's closet in a fixed number of round trips
 
-        # Display results in a formatted way
-        for i, item in enumerate(results, 1):
-            print(f"\n📦 Item {i}:")
-            print(f"   MongoDB ID: {item.get('_id', 'N/A')}")
-            print(f"   Closet Item ID: {item.get('closet_item_id', 'N/A')}")
-            print(f"   Type: {item.get('type', 'N/A')}")
+    The products are fetched with one projected $in query and the closet
+    items are upserted with one unordered bulk_write, so a failed item does
+    not stop the others and products already in the closet are not
+    duplicated. Their IDs come from one more $in query.
 
-            # Handle different naming conventions
-            product_name = item.get('product_name') or item.get('title', 'N/A')
-            print(f"   Product Name: {product_name}")
+    Args:
+        product_ids (list): Product _ids as strings (at most MAX_CLOSET_BATCH_SIZE)
+        user_id (str): Owner of the closet
+
+    Returns:
+        list: One {"product_id", "success", "mongodb_id" and "created", or "error"}
+            per requested ID, in order
+    """
+    closets_collection = get_db()["closets"]
+    object_ids = parse_product_ids(product_ids)
+    products = {}
+    if object_ids:
+        with span("mongo-products"):
+            cursor = get_db()["products"].find({"_id": {"$in": list(set(object_ids.values()))}}, PRODUCT_PROJECTION)
+            products = {product["_id"]: product for product in cursor}
+
+    results, documents, positions = build_closet_batch(product_ids, object_ids, products, user_id)
+    if not documents:
+        return results
+    try:
+        with span("mongo-insert"):
+            upserted_ids = closets_collection.bulk_write(closet_batch_upserts(documents), ordered=False).upserted_ids
+        write_errors = ()
+    except BulkWriteError as e:
+        upserted_ids = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
+        write_errors = e.details.get("writeErrors", [])
+
+    failed, existing_product_ids = split_closet_batch_writes(documents, upserted_ids, write_errors)
+    existing_ids = {}
+    if existing_product_ids:
+        with span("mongo-closet"):
+            existing = closets_collection.find(
+                {"user_id": user_id, "original_product_id": {"$in": existing_product_ids}}, {"original_product_id": 1}
+            )
+            existing_ids = {item["original_product_id"]: item["_id"] for item in existing}
+    invalidate_closet_summary(user_id)
+    return record_closet_batch_writes(results, documents, positions, upserted_ids, existing_ids, failed)
 
-            print(f"   Brand: {item.get('brand', 'N/A')}")
+def add_to_closet(closet_item):
+    """
+    Add a given item/row to the 'closets' collection in MongoDB
 
-            # Display colors
-            colors = item.get('colors', {})
-            if colors:
-                primary_color = colors.get('primary', 'N/A')
-                secondary_color = colors.get('secondary', 'N/A')
-                print(f"   Colors: {primary_color} / {secondary_color}")
+    One insert_one and nothing else: MongoDB creates the collection on the
+    first insert, so there is no existence check before or after, and no
+    count of the whole collection.
 
-            # Display category info
-            category = item.get('category', 'N/A')
-            subcategory = item.get('subcategory', 'N/A')
-            print(f"   Category: {category} > {subcategory}")
+    DEPRECATED: Use add_product_to_closet() for adding products by ID
 
-            # Display price from metadata
-            metadata = item.get('metadata', {})
-            price = metadata.get('price', 'N/A')
-            print(f"   Price: ${price}")
+    Args:
+        closet_item (dict): The item data to add to closets collection
 
-            # Display creation date
-            created_at = item.get('created_at', 'N/A')
-            print(f"   Created: {created_at}")
+    Returns:
+        str: The inserted document ID or None if failed
+    """
+    try:
+        # Add an ID field if not provided for better tracking
+        if "closet_item_id" not in closet_item:
+            closet_item["closet_item_id"] = str(uuid.uuid4())
+        # Items without an owner go to the shared closet
+        closet_item.setdefault("user_id", DEFAULT_USER_ID)
+        closet_item.setdefault("created_at", datetime.now(timezone.utc))
+        expires_at = closet_item_expiry(closet_item["created_at"])
+        if expires_at is not None:
+            closet_item.setdefault("expires_at", expires_at)
 
-            # Display image URL if available
-            image_url = item.get('image_url', '') or item.get('urls', {}).get('image', '')
-            if image_url:
-                print(f"   Image: {image_url[:60]}{'...' if len(image_url) > 60 else ''}")
+        with span("mongo-insert"):
+            result = get_db()["closets"].insert_one(closet_item)
+        invalidate_closet_summary(closet_item["user_id"])
 
-            print("-" * 40)
+        print(f"Successfully added item to closet with ID: {result.inserted_id}")
+        return str(result.inserted_id)
 
-        print(f"\n✅ Displayed {len(results)} closet items")
-        return results
+    except Exception as e:
+        print(f"Error adding item to closet: {e}")
+        return None
+
+def get_all_closet_items(limit=None, projection=None, user_id=DEFAULT_USER_ID):
+    """
+    Fetch a user's closet items in one projected query
+
+    A missing closets collection simply yields no documents, so there is no
+    existence check or count. Use print_closet_items to display them.
+
+    Args:
+        limit (int, optional): Limit the number of results returned
+        projection (dict, optional): Fields to fetch (defaults to whole documents)
+        user_id (str): Owner of the closet
 
+    Returns:
+        list: Closet items, oldest first
+    """
+    try:
+        cursor = get_db()["closets"].find({"user_id": user_id}, projection).sort(CLOSET_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        with span("mongo-closet"):
+            return list(cursor)
     except Exception as e:
         print(f"❌ Error retrieving closet items: {e}")
         return []
 
-def clear_closets_collection():
+def plan_closet_page(user_id, page_size, cursor=None):
     """
-    Clear all items from the 'closets' collection
-    This function removes all documents from the closets collection
+    Build the keyset query for one page of a user's closet items
+
+    Items are ordered by (created_at, _id) within the user and each page
+    continues strictly after the last item of the previous one, so any page
+    costs one range scan of the user_id_created_at_id index.
+
+    Args:
+        user_id (str): Owner of the closet
+        page_size (int): Number of items per page (capped at MAX_CLOSET_PAGE_SIZE)
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
 
     Returns:
-        dict: Result of the clear operation
+        tuple: (filter, limit); limit fetches one extra item to detect another page
+
+    Raises:
+        ValueError: If the cursor was not produced by a closet page
     """
-    try:
-        closets_collection = db["closets"]
+    page_size = max(1, min(page_size, MAX_CLOSET_PAGE_SIZE))
+    mongo_filter = {"user_id": user_id}
+    if cursor is not None:
+        if cursor["source"] != "closet":
+            raise ValueError("Invalid pagination cursor")
+        try:
+            created_at = datetime.fromisoformat(cursor["sort_value"])
+        except (TypeError, ValueError):
+            raise ValueError("Invalid pagination cursor")
+        mongo_filter["$or"] = [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "_id": {"$gt": cursor["last_id"]}},
+        ]
+    return mongo_filter, page_size + 1
+
+def closet_page_projection(projection):
+    """
+    Extend a projection with the keyset fields closet cursors are built from
 
-        # Check if collection exists
-        existing_collections = db.list_collection_names()
-        if "closets" not in existing_collections:
-            print("ℹ️ 'closets' collection doesn't exist - nothing to clear")
-            return {"success": True, "message": "Collection doesn't exist", "deleted_count": 0}
+    Args:
+        projection (dict, optional): Requested fields (None fetches whole documents)
 
-        # Get count before deletion
-        initial_count = closets_collection.count_documents({})
+    Returns:
+        dict: Projection that also includes created_at
+    """
+    return {**projection, "created_at": 1} if projection else projection
 
-        if initial_count == 0:
-            print("ℹ️ 'closets' collection is already empty")
-            return {"success": True, "message": "Collection already empty", "deleted_count": 0}
+def make_closet_page(items, page_size):
+    """
+    Trim fetched closet items to a page and encode the cursor for the next one
 
-        # Delete all documents
-        result = closets_collection.delete_many({})
+    Args:
+        items (list): Up to page_size + 1 items; the extra one only signals another page
+        page_size (int): Number of items per page
 
-        print(f"🗑️ Cleared 'closets' collection")
-        print(f"   Deleted {result.deleted_count} items")
+    Returns:
+        dict: "items" and "next_cursor" (None on the last page)
+    """
+    page_size = max(1, min(page_size, MAX_CLOSET_PAGE_SIZE))
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_search_cursor("closet", last["created_at"].isoformat(), last["_id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+def get_closet_items_page(page_size=DEFAULT_CLOSET_PAGE_SIZE, cursor=None, projection=CLOSET_ITEM_PROJECTION, include_count=False, user_id=DEFAULT_USER_ID):
+    """
+    Fetch one page of a user's closet items with a single projected query
+
+    Args:
+        page_size (int): Number of items per page (capped at MAX_CLOSET_PAGE_SIZE)
+        cursor (dict, optional): Decoded cursor from decode_search_cursor
+        projection (dict, optional): Fields to fetch (defaults to the closet item response fields)
+        include_count (bool): Also count the user's closet items (one more query)
+        user_id (str): Owner of the closet
+
+    Returns:
+        dict: "items", "next_cursor" (None on the last page) and, when
+            requested, "total_count"
+    """
+    closets_collection = get_db()["closets"]
+    mongo_filter, limit = plan_closet_page(user_id, page_size, cursor)
+    with span("mongo-closet"):
+        items = list(closets_collection.find(mongo_filter, closet_page_projection(projection)).sort(CLOSET_SORT).limit(limit))
+    page = make_closet_page(items, page_size)
+    if include_count:
+        with span("mongo-count"):
+            page["total_count"] = closets_collection.count_documents({"user_id": user_id})
+    return page
+
+def print_closet_items(items):
+    """
+    Print closet items as a readable report (debugging aid, see the show-closet command)
 
-        # Verify collection is empty
-        final_count = closets_collection.count_documents({})
-        if final_count == 0:
-            print("✅ Collection cleared successfully")
+    Args:
+        items (list): Closet item documents
+    """
+    print(f"👕 Closets Collection Data")
+    print("=" * 60)
+    if not items:
+        print("❌ No items found in closets collection")
+        return
+
+    # Display results in a formatted way
+    for i, item in enumerate(items, 1):
+        print(f"\n📦 Item {i}:")
+        print(f"   MongoDB ID: {item.get('_id', 'N/A')}")
+        print(f"   Closet Item ID: {item.get('closet_item_id', 'N/A')}")
+        print(f"   Type: {item.get('type', 'N/A')}")
+
+        # Handle different naming conventions
+        product_name = item.get('product_name') or item.get('title', 'N/A')
+        print(f"   Product Name: {product_name}")
+
+        print(f"   Brand: {item.get('brand', 'N/A')}")
+
+        # Display colors
+        colors = item.get('colors', {})
+        if colors:
+            primary_color = colors.get('primary', 'N/A')
+            secondary_color = colors.get('secondary', 'N/A')
+            print(f"   Colors: {primary_color} / {secondary_color}")
+
+        # Display category info
+        category = item.get('category', 'N/A')
+        subcategory = item.get('subcategory', 'N/A')
+        print(f"   Category: {category} > {subcategory}")
+
+        # Display price from metadata
+        metadata = item.get('metadata', {})
+        price = metadata.get('price', 'N/A')
+        print(f"   Price: ${price}")
+
+        # Display creation date
+        created_at = item.get('created_at', 'N/A')
+        print(f"   Created: {created_at}")
+
+        # Display image URL if available
+        image_url = item.get('image_url', '') or item.get('urls', {}).get('image', '')
+        if image_url:
+            print(f"   Image: {image_url[:60]}{'...' if len(image_url) > 60 else ''}")
+
+        print("-" * 40)
+
+    print(f"\n✅ Displayed {len(items)} closet items")
+
+def clear_closets_collection(user_id=None):
+    """
+    Clear items from the 'closets' collection
+
+    Clearing every closet drops the collection and recreates its indexes,
+    which takes the same time however many items there are. Clearing one
+    user's closet deletes their items in batches of CLOSET_CLEAR_BATCH_SIZE
+    found through the user_id index, so no single delete runs long. Nothing
+    is counted before or after.
+
+    Args:
+        user_id (str, optional): Only clear this user's closet (default: every user's)
+
+    Returns:
+        dict: Result of the clear operation
+    """
+    try:
+        db = get_db()
+        closets_collection = db["closets"]
+        if user_id is None:
+            # Collection metadata, not a scan
+            deleted_count = closets_collection.estimated_document_count()
+            with span("mongo-delete"):
+                db.drop_collection("closets")
+            ensure_closet_indexes()
         else:
-            print(f"⚠️ Warning: {final_count} items still remain")
+            deleted_count = 0
+            while True:
+                with span("mongo-delete"):
+                    ids = [item["_id"] for item in closets_collection.find(
+                        closet_owner_filter(user_id), {"_id": 1}).limit(CLOSET_CLEAR_BATCH_SIZE)]
+                    if ids:
+                        deleted_count += closets_collection.delete_many({"_id": {"$in": ids}}).deleted_count
+                if len(ids) < CLOSET_CLEAR_BATCH_SIZE:
+                    break
+        invalidate_closet_summary(user_id)
 
+        print(f"🗑️ Cleared 'closets' collection")
+        print(f"   Deleted {deleted_count} items")
         return {
             "success": True,
-            "message": f"Successfully cleared closets collection",
-            "deleted_count": result.deleted_count,
-            "initial_count": initial_count,
-            "final_count": final_count
+            "message": "Successfully cleared closets collection",
+            "deleted_count": deleted_count
         }
 
     except Exception as e:
@@ -443,47 +1383,56 @@ def clear_closets_collection():
             "deleted_count": 0
         }
 
-def get_outfit_suggestions_with_llm(user_query):
+OUTFIT_SUGGESTION_MODEL = "gemini-2.5-pro"  # Text-only model for outfit suggestions
+# Part of the outfit cache key; bump when the prompt or answer format changes
+OUTFIT_PROMPT_VERSION = 1
+# Closet fields the outfit prompt describes, on top of the response fields
+OUTFIT_CLOSET_PROJECTION = {**CLOSET_ITEM_PROJECTION, "subcategory": 1}
+
+# Gemini answers per (closet contents, query, model, prompt version). The
+# SQLite tier is shared by the workers on a host and survives restarts;
+# OUTFIT_CACHE_PATH= (empty) keeps it in memory only
+outfit_response_cache = ResponseCache(
+    path=os.getenv("OUTFIT_CACHE_PATH", "outfit_cache.sqlite3") or None,
+    maxsize=int(os.getenv("OUTFIT_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("OUTFIT_CACHE_TTL_SECONDS", str(24 * 3600)))
+)
+
+def outfit_item_lines(closet_items):
     """
-    Get outfit suggestions based on natural language query using closet items and Gemini LLM
-    
+    Numbered closet item descriptions for the outfit prompt
+
     Args:
-        user_query (str): Natural language query about the occasion or outfit preference
-        
+        closet_items (list): Closet items, numbered from 1 in this order
+
     Returns:
-        dict: Outfit suggestions with LLM-generated explanation and suggested items
+        list: One "n. title (category) in color" line per item
     """
-    try:
-        from google import genai
-        import os
-        import json
-        
-        # Get all closet items
-        closet_items = get_all_closet_items()
-        
-        if not closet_items:
-            return {
-                "success": False,
-                "message": "No items found in closet",
-                "outfit_suggestion": "",
-                "suggested_items": []
-            }
-        
-        # Format closet items for LLM with numbered IDs
-        items_for_llm = []
-        for i, item in enumerate(closet_items):
-            # Handle both old and new schema
-            color = item.get("product_color") or item.get("colors", {}).get("primary", "unknown color")
-            category = item.get("product_category") or item.get("subcategory", "N/A")
-            title = item.get("product_title") or item.get("product_name") or item.get("title", "Unknown Item")
-            
-            item_desc = f"{i+1}. {title} ({category}) in {color}"
-            items_for_llm.append(item_desc)
-        
-        # Create prompt for Gemini
-        closet_items_text = "\n".join(items_for_llm)
-        
-        prompt = f"""
+    items_for_llm = []
+    for i, item in enumerate(closet_items):
+        # Handle both old and new schema
+        color = item.get("product_color") or item.get("colors", {}).get("primary", "unknown color")
+        category = item.get("product_category") or item.get("subcategory", "N/A")
+        title = item.get("product_title") or item.get("product_name") or item.get("title", "Unknown Item")
+
+        item_desc = f"{i+1}. {title} ({category}) in {color}"
+        items_for_llm.append(item_desc)
+    return items_for_llm
+
+def build_outfit_prompt(user_query, closet_items):
+    """
+    Gemini prompt listing the closet items by number
+
+    Args:
+        user_query (str): Occasion or outfit preference
+        closet_items (list): Closet items, numbered from 1 in this order
+
+    Returns:
+        str: Prompt asking for a JSON suggestion and item numbers
+    """
+    closet_items_text = "\n".join(outfit_item_lines(closet_items))
+
+    return f"""
 You are a professional fashion stylist. A user wants outfit suggestions for: "{user_query}"
 
 Available items in their closet (numbered):
@@ -512,153 +1461,188 @@ Example:
 }}
 """
 
-        # Initialize Gemini client
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            return {
-                "success": False,
-                "message": "Google API key not configured",
-                "outfit_suggestion": "",
-                "suggested_items": []
-            }
-        
-        client = genai.Client(api_key=api_key)
-        
-        # Generate outfit suggestions using Gemini
-        response = client.models.generate_content(
-            model='gemini-2.5-pro',  # Using text-only model for outfit suggestions
-            contents=[prompt]
-        )
-        
-        # Extract the generated text
-        if response.candidates and len(response.candidates) > 0:
-            suggestion_text = response.candidates[0].content.parts[0].text
-            
-            try:
-                # Parse JSON response from LLM
-                # Clean the response text (remove any markdown formatting)
-                clean_text = suggestion_text.strip()
-                if clean_text.startswith('```json'):
-                    clean_text = clean_text[7:]
-                if clean_text.endswith('```'):
-                    clean_text = clean_text[:-3]
-                clean_text = clean_text.strip()
-                
-                parsed_response = json.loads(clean_text)
-                
-                # Extract suggested item numbers and get the actual items
-                suggested_item_numbers = parsed_response.get("item_numbers", [])
-                suggested_items = []
-                
-                for item_number in suggested_item_numbers:
-                    # Convert to 0-based index
-                    try:
-                        index = int(item_number) - 1
-                        if 0 <= index < len(closet_items):
-                            item = closet_items[index]
-                            formatted_item = {
-                                "id": str(item.get("_id", "")),
-                                "product_name": item.get("product_title") or item.get("product_name") or item.get("title", "N/A"),
-                                "product_title": item.get("product_title", "N/A"),
-                                "product_price": item.get("product_price") or item.get("metadata", {}).get("price", "N/A"),
-                                "product_color": item.get("product_color") or item.get("colors", {}).get("primary", "N/A"),
-                                "product_category": item.get("product_category") or item.get("category", "N/A"),
-                                "product_size": item.get("product_size", "N/A"),
-                                "image_url": item.get("image_url", ""),
-                                "product_url": item.get("product_url", "")
-                            }
-                            suggested_items.append(formatted_item)
-                    except (ValueError, IndexError):
-                        continue
-                
-                # Get the AI's concise suggestion (not truncated)
-                outfit_suggestion = parsed_response.get("outfit_suggestion", "")
-                
-                return {
-                    "success": True,
-                    "query": user_query,
-                    "total_closet_items": len(closet_items),
-                    "outfit_suggestion": outfit_suggestion,  # Use AI's complete suggestion
-                    "suggested_items": suggested_items,
-                    "message": "Outfit suggestions generated successfully"
-                }
-                
-            except json.JSONDecodeError:
-                # Fallback: if JSON parsing fails, return the raw text as suggestion
-                return {
-                    "success": True,
-                    "query": user_query,
-                    "total_closet_items": len(closet_items),
-                    "outfit_suggestion": suggestion_text,  # Use complete text without truncation
-                    "suggested_items": [],
-                    "message": "Outfit suggestions generated successfully (fallback mode)"
-                }
-        else:
-            return {
-                "success": False,
-                "message": "Failed to generate outfit suggestions from LLM",
-                "outfit_suggestion": "",
-                "suggested_items": []
-            }
-            
-    except Exception as e:
-        print(f"Error generating outfit suggestions: {e}")
+def outfit_cache_key(user_query, closet_items, model=OUTFIT_SUGGESTION_MODEL):
+    """
+    Cache key for a Gemini outfit answer
+
+    The closet enters as a fingerprint of the item lines the prompt shows,
+    so adding, removing or editing an item yields a new key (old entries
+    age out), and users with the same closet contents share answers. The
+    query is normalized to its lowercase word tokens.
+
+    Args:
+        user_query (str): Occasion or outfit preference
+        closet_items (list): Closet items in prompt order
+        model (str): Gemini model answering
+
+    Returns:
+        str: Hex SHA-256 of prompt version, model, query and closet fingerprint
+    """
+    closet_fingerprint = hashlib.sha256("\n".join(outfit_item_lines(closet_items)).encode()).hexdigest()
+    parts = [OUTFIT_PROMPT_VERSION, model, " ".join(tokenize(user_query)), closet_fingerprint]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+def outfit_error(message):
+    """
+    Failed outfit suggestions result
+
+    Args:
+        message (str): What went wrong
+
+    Returns:
+        dict: Result with success False and no suggestion
+    """
+    return {
+        "success": False,
+        "message": message,
+        "outfit_suggestion": "",
+        "suggested_items": []
+    }
+
+def parse_outfit_answer(response):
+    """
+    Extract the suggestion and item numbers from a Gemini response
+
+    Args:
+        response: generate_content response
+
+    Returns:
+        dict: "outfit_suggestion", "item_numbers" and "fallback" (True when the
+            text was not the requested JSON), or None without a candidate
+    """
+    if not (response.candidates and len(response.candidates) > 0):
+        return None
+    suggestion_text = response.candidates[0].content.parts[0].text
+
+    try:
+        # Parse JSON response from LLM
+        # Clean the response text (remove any markdown formatting)
+        clean_text = suggestion_text.strip()
+        if clean_text.startswith('```json'):
+            clean_text = clean_text[7:]
+        if clean_text.endswith('```'):
+            clean_text = clean_text[:-3]
+        clean_text = clean_text.strip()
+
+        parsed_response = json.loads(clean_text)
         return {
-            "success": False,
-            "message": f"Error generating outfit suggestions: {str(e)}",
-            "outfit_suggestion": "",
-            "suggested_items": []
+            # The AI's concise suggestion (not truncated)
+            "outfit_suggestion": parsed_response.get("outfit_suggestion", ""),
+            "item_numbers": parsed_response.get("item_numbers", []),
+            "fallback": False
         }
+    except json.JSONDecodeError:
+        # Fallback: if JSON parsing fails, return the raw text as suggestion
+        return {"outfit_suggestion": suggestion_text, "item_numbers": [], "fallback": True}
 
-def get_closet_summary():
+def make_outfit_result(answer, user_query, closet_items):
     """
-    Display a summary of closets collection statistics
+    Outfit suggestions result for an answer from parse_outfit_answer
+
+    Args:
+        answer (dict): Parsed (or cached) Gemini answer
+        user_query (str): Occasion or outfit preference
+        closet_items (list): Closet items in prompt order
 
     Returns:
-        dict: Summary statistics
+        dict: Outfit suggestions with LLM-generated explanation and suggested items
     """
-    try:
-        closets_collection = db["closets"]
+    suggested_items = []
+    for item_number in answer["item_numbers"]:
+        # Convert to 0-based index
+        try:
+            index = int(item_number) - 1
+            if 0 <= index < len(closet_items):
+                suggested_items.append(serialize_closet_item(closet_items[index]))
+        except (ValueError, TypeError):
+            continue
+
+    message = "Outfit suggestions generated successfully"
+    if answer["fallback"]:
+        message += " (fallback mode)"
+    return {
+        "success": True,
+        "query": user_query,
+        "total_closet_items": len(closet_items),
+        "outfit_suggestion": answer["outfit_suggestion"],
+        "suggested_items": suggested_items,
+        "message": message
+    }
 
-        # Check if collection exists
-        existing_collections = db.list_collection_names()
-        if "closets" not in existing_collections:
-            print("❌ 'closets' collection doesn't exist yet")
-            return {}
+def get_outfit_suggestions_with_llm(user_query, user_id=DEFAULT_USER_ID):
+    """
+    Get outfit suggestions based on natural language query using closet items and Gemini LLM
 
-        print(f"📊 Closets Collection Summary")
-        print("=" * 50)
+    Uses the process-wide Gemini client from llm_client, so its connections
+    are reused across calls. Answers are cached in outfit_response_cache;
+    the same question about an unchanged closet skips Gemini.
 
-        # Total count
-        total_items = closets_collection.count_documents({})
-        print(f"Total items: {total_items}")
+    Args:
+        user_query (str): Natural language query about the occasion or outfit preference
+        user_id (str): Owner of the closet to pick items from
+        
+    Returns:
+        dict: Outfit suggestions with LLM-generated explanation and suggested items
+    """
+    try:
+        # Get all closet items (response fields plus subcategory for the prompt)
+        closet_items = get_all_closet_items(projection=OUTFIT_CLOSET_PROJECTION, user_id=user_id)
+        if not closet_items:
+            return outfit_error("No items found in closet")
+
+        cache_key = outfit_cache_key(user_query, closet_items)
+        with span("outfit-cache"):
+            answer = outfit_response_cache.get(cache_key)
+        if answer is None:
+            if not os.getenv('GOOGLE_API_KEY'):
+                return outfit_error("Google API key not configured")
+            with span("gemini"):
+                response = get_genai_client().models.generate_content(
+                    model=OUTFIT_SUGGESTION_MODEL,
+                    contents=[build_outfit_prompt(user_query, closet_items)]
+                )
+            answer = parse_outfit_answer(response)
+            if answer is None:
+                return outfit_error("Failed to generate outfit suggestions from LLM")
+            outfit_response_cache.set(cache_key, answer)
+        return make_outfit_result(answer, user_query, closet_items)
+            
+    except Exception as e:
+        print(f"Error generating outfit suggestions: {e}")
+        return outfit_error(f"Error generating outfit suggestions: {str(e)}")
 
-        if total_items == 0:
-            print("Collection is empty")
-            return {"total_items": 0}
+def get_closet_summary(user_id=DEFAULT_USER_ID):
+    """
+    Display a summary of a user's closet
 
-        # Count by type
-        type_counts = {}
-        for item_type in closets_collection.distinct("type"):
-            count = closets_collection.count_documents({"type": item_type})
-            type_counts[item_type] = count
-            print(f"  - {item_type}: {count} items")
+    Counts by type, category and color and the newest items come from one
+    $facet aggregation over the user's items, cached in closet_summary_cache
+    until the closet is written to.
 
+    Args:
+        user_id (str): Owner of the closet
 
+    Returns:
+        dict: Summary from format_closet_summary ({} if it failed)
+    """
+    try:
+        summary = closet_summary_cache.get(user_id)
+        if summary is None:
+            generation = closet_summary_cache.generation
+            with span("mongo-closet-summary"):
+                result = next(get_db()["closets"].aggregate(closet_summary_pipeline(user_id)), {})
+            summary = format_closet_summary(result)
+            closet_summary_cache.set(user_id, summary, generation=generation)
+
+        print(f"📊 Closet Summary ({user_id})")
+        print("=" * 50)
+        print(f"Total items: {summary['total_items']}")
+        for bucket in summary["type_counts"]:
+            print(f"  - {bucket['value']}: {bucket['count']} items")
 
-        # Most recent items
         print(f"\nMost recent items:")
-        recent_items = list(closets_collection.find().sort("created_at", -1).limit(3))
-        for i, item in enumerate(recent_items, 1):
-            product_name = item.get('product_name') or item.get('title', 'N/A')
-            created_at = item.get('created_at', 'N/A')
-            print(f"  {i}. {product_name} - {created_at}")
-
-        summary = {
-            "total_items": total_items,
-            "type_counts": type_counts,
-            "recent_items": len(recent_items)
-        }
+        for i, item in enumerate(summary["recent_items"], 1):
+            print(f"  {i}. {item['product_name']}")
 
         print(f"\n✅ Summary complete")
         return summary
@@ -690,7 +1674,7 @@ def list_all_databases():
         list: List of database names
     """
     try:
-        databases = client.list_database_names()
+        databases = get_client().list_database_names()
         print("Available databases:")
         for db_name in databases:
             print(f"  - {db_name}")
@@ -711,10 +1695,10 @@ def list_all_collections(database_name=None):
     """
     try:
         if database_name:
-            target_db = client.get_database(database_name)
+            target_db = get_client().get_database(database_name)
         else:
-            target_db = db
-            database_name = db.name
+            target_db = get_db()
+            database_name = DB_NAME
 
         collections = target_db.list_collection_names()
         print(f"Collections in '{database_name}' database:")
@@ -741,9 +1725,9 @@ def explore_collection_schema(collection_name, database_name=None, sample_size=1
     """
     try:
         if database_name:
-            target_db = client.get_database(database_name)
+            target_db = get_client().get_database(database_name)
         else:
-            target_db = db
+            target_db = get_db()
 
         collection = target_db[collection_name]
 
@@ -817,9 +1801,9 @@ def get_sample_documents(collection_name, database_name=None, limit=5):
     """
     try:
         if database_name:
-            target_db = client.get_database(database_name)
+            target_db = get_client().get_database(database_name)
         else:
-            target_db = db
+            target_db = get_db()
 
         collection = target_db[collection_name]
         samples = list(collection.find().limit(limit))
@@ -860,7 +1844,7 @@ def full_database_exploration(database_name=None):
     if database_name:
         target_db_name = database_name
     else:
-        target_db_name = db.name
+        target_db_name = DB_NAME
 
     print(f"\n🎯 Exploring database: {target_db_name}")
     print("=" * 60)
@@ -958,11 +1942,11 @@ def test_closet_display():
 
     # Test 2: Display all items
     print("\n📦 Testing display all closet items...")
-    get_all_closet_items(limit=5)  # Limit to 5 for testing
+    print_closet_items(get_all_closet_items(limit=5))  # Limit to 5 for testing
 
     # Test 3: Display limited items
     print("\n👤 Testing display with limit...")
-    get_all_closet_items(limit=3)
+    print_closet_items(get_all_closet_items(limit=3))
 
     print(f"\n✅ Closet display tests completed!")
 
@@ -1081,3 +2065,35 @@ def test_outfit_suggestions():
     print(f"\n✅ Outfit suggestions tests completed!")
 
 # Example usage functions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MongoDB maintenance commands for the Fashion Fitter API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Create search indexes and backfill normalized product fields")
+    backfill_parser.add_argument("--batch-size", type=int, default=500)
+
+    semantic_parser = subparsers.add_parser("build-semantic-index", help="Embed all products and save the semantic search index")
+    semantic_parser.add_argument("--path", default=os.getenv("SEMANTIC_INDEX_PATH", "semantic_index_data"))
+
+    closet_parser = subparsers.add_parser("show-closet", help="Print closet items for debugging")
+    closet_parser.add_argument("--limit", type=int, default=None)
+    closet_parser.add_argument("--user-id", default=DEFAULT_USER_ID)
+
+    args = parser.parse_args()
+    if args.command == "show-closet":
+        print_closet_items(get_all_closet_items(limit=args.limit, user_id=args.user_id))
+    elif args.command == "backfill":
+        ensure_product_indexes()
+        backfill_normalized_fields(batch_size=args.batch_size)
+        backfill_closet_owners()
+        backfill_closet_expiry()
+        dedupe_closet_items()
+        ensure_closet_indexes()
+    elif args.command == "build-semantic-index":
+        from semantic_index import semantic_index
+        count = semantic_index.build(get_db()["products"])
+        semantic_index.save(args.path)
+        print(f"✅ Saved semantic index with {count} products to {args.path}")
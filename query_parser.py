@@ -0,0 +1,407 @@
+"""
+Natural language query parsing for product search
+
+The keyword tables are compiled once at import into a single phrase lookup
+table. A query is tokenized once and classified in one left-to-right pass
+over its words, so keywords only match whole words: "red" never matches
+inside "shirred" and "tan" never matches inside "tank".
+"""
+import re
+from typing import NamedTuple, Optional, Tuple
+
+# Common colors mapping (canonical color -> variations)
+COLOR_KEYWORDS = {
+    'blue': ['blue', 'navy', 'dark blue', 'light blue'],
+    'red': ['red', 'maroon', 'crimson', 'cherry'],
+    'green': ['green', 'olive', 'forest green', 'lime'],
+    'black': ['black', 'dark'],
+    'white': ['white', 'cream', 'off-white'],
+    'grey': ['grey', 'gray', 'charcoal'],
+    'yellow': ['yellow', 'golden'],
+    'pink': ['pink', 'rose'],
+    'brown': ['brown', 'tan', 'beige'],
+    'purple': ['purple', 'violet'],
+    'orange': ['orange'],
+    'multi': ['multi', 'multicolor', 'printed', 'pattern']
+}
+
+# Category/subcategory mapping
+CATEGORY_MAPPING = {
+    'shirt': 'Shirts',
+    'shirts': 'Shirts',
+    't-shirt': 'T-shirts & Polos',
+    't shirt': 'T-shirts & Polos',
+    'tshirt': 'T-shirts & Polos',
+    't-shirts': 'T-shirts & Polos',
+    't shirts': 'T-shirts & Polos',
+    'tshirts': 'T-shirts & Polos',
+    'polo': 'T-shirts & Polos',
+    'polos': 'T-shirts & Polos',
+    'jeans': 'Jeans',
+    'pants': 'Trousers & Chinos',
+    'trousers': 'Trousers & Chinos',
+    'chinos': 'Trousers & Chinos',
+    'shorts': 'Shorts',
+    'jacket': 'Jackets & Coats',
+    'jackets': 'Jackets & Coats',
+    'coat': 'Jackets & Coats',
+    'coats': 'Jackets & Coats',
+    'sweater': 'Sweaters',
+    'sweaters': 'Sweaters',
+    'hoodie': 'Hoodies & Sweatshirts',
+    'hoodies': 'Hoodies & Sweatshirts',
+    'sweatshirt': 'Hoodies & Sweatshirts',
+    'sweatshirts': 'Hoodies & Sweatshirts'
+}
+
+# Size words that are unambiguous on their own (single letters need "size")
+SIZE_KEYWORDS = {
+    'xxs': 'XXS',
+    'xs': 'XS',
+    'extra small': 'XS',
+    'small': 'S',
+    'medium': 'M',
+    'large': 'L',
+    'xl': 'XL',
+    'x-large': 'XL',
+    'extra large': 'XL',
+    'xxl': 'XXL',
+    '2xl': 'XXL',
+    'xxxl': 'XXXL',
+    '3xl': 'XXXL'
+}
+
+# Price phrases (phrase -> which bound the following amount sets)
+PRICE_KEYWORDS = {
+    'under': 'max',
+    'below': 'max',
+    'less than': 'max',
+    'cheaper than': 'max',
+    'up to': 'max',
+    'max': 'max',
+    'over': 'min',
+    'above': 'min',
+    'more than': 'min',
+    'at least': 'min',
+    'min': 'min',
+    'between': 'between'
+}
+
+# Connecting words that carry no search meaning ("black or navy", "shirts for work")
+STOP_WORDS = {'a', 'an', 'and', 'or', 'the', 'for', 'with', 'in', 'of', 'on', 'to'}
+
+# Style/material/fit modifiers (variation -> canonical modifier)
+MODIFIER_KEYWORDS = {
+    'casual': 'casual',
+    'formal': 'formal',
+    'slim': 'slim fit',
+    'slim fit': 'slim fit',
+    'regular fit': 'regular fit',
+    'relaxed fit': 'relaxed fit',
+    'oversized': 'oversized',
+    'long sleeve': 'long sleeve',
+    'long-sleeve': 'long sleeve',
+    'short sleeve': 'short sleeve',
+    'short-sleeve': 'short sleeve',
+    'sleeveless': 'sleeveless',
+    'cotton': 'cotton',
+    'linen': 'linen',
+    'wool': 'wool',
+    'denim': 'denim',
+    'leather': 'leather',
+    'silk': 'silk',
+    'striped': 'striped',
+    'plaid': 'plaid',
+    'solid': 'solid',
+    'graphic': 'graphic'
+}
+
+
+class ParsedQuery(NamedTuple):
+    """
+    Structured result of parsing a natural language product query
+
+    All attribute tuples hold canonical values in order of first appearance,
+    without duplicates. ``terms`` holds the words that matched no keyword.
+    """
+    text: str
+    tokens: Tuple[str, ...] = ()
+    colors: Tuple[str, ...] = ()
+    categories: Tuple[str, ...] = ()
+    sizes: Tuple[str, ...] = ()
+    modifiers: Tuple[str, ...] = ()
+    terms: Tuple[str, ...] = ()
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    @property
+    def color(self) -> Optional[str]:
+        """First detected canonical color, or None"""
+        return self.colors[0] if self.colors else None
+
+    @property
+    def category(self) -> Optional[str]:
+        """First detected canonical category, or None"""
+        return self.categories[0] if self.categories else None
+
+    @property
+    def has_filters(self) -> bool:
+        """True when the query names a color, category, size or price bound"""
+        return bool(self.colors or self.categories or self.sizes
+                    or self.min_price is not None or self.max_price is not None)
+
+    @property
+    def cache_key(self) -> tuple:
+        """
+        Order-insensitive key for caching results of this query
+
+        "Blue Shirts" and "shirts blue" share a key; word order never changes
+        the filters or the BM25 ranking.
+        """
+        return (
+            tuple(sorted(self.colors)),
+            tuple(sorted(self.categories)),
+            tuple(sorted(self.sizes)),
+            tuple(sorted(self.modifiers)),
+            tuple(sorted(set(self.tokens))),
+            self.min_price,
+            self.max_price
+        )
+
+
+def _build_keyword_table():
+    table = {}
+    for color, variations in COLOR_KEYWORDS.items():
+        for variation in variations:
+            table[variation] = ('colors', color)
+    for keyword, category in CATEGORY_MAPPING.items():
+        table[keyword] = ('categories', category)
+    for keyword, size in SIZE_KEYWORDS.items():
+        table[keyword] = ('sizes', size)
+    for keyword, modifier in MODIFIER_KEYWORDS.items():
+        table[keyword] = ('modifiers', modifier)
+    for keyword, bound in PRICE_KEYWORDS.items():
+        table[keyword] = ('price', bound)
+    return table
+
+
+_KEYWORD_TABLE = _build_keyword_table()
+
+# First word -> lengths of the multi-word phrases it starts, longest first, so
+# "dark blue" wins over "dark" and single words need only one dict lookup
+_PHRASE_LENGTHS = {}
+for _phrase in _KEYWORD_TABLE:
+    _words = _phrase.split()
+    if len(_words) > 1:
+        _PHRASE_LENGTHS.setdefault(_words[0], set()).add(len(_words))
+_PHRASE_LENGTHS = {word: tuple(sorted(lengths, reverse=True)) for word, lengths in _PHRASE_LENGTHS.items()}
+del _phrase, _words
+
+# Dollar amounts and decimals stay whole ("$1,299.99", "29.99"); everything
+# else splits into words, keeping "t-shirt" and "men's" together
+_TOKEN_PATTERN = re.compile(r"\$\d+(?:,\d{3})*(?:\.\d+)?|\d+\.\d+|[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+_SIZE_NUMBER = re.compile(r"(\d+)w?")
+
+
+def canonical_size(token):
+    """
+    Canonical form of one size token, shared by stored sizes and queries
+
+    Args:
+        token (str): Lowercase size token, e.g. "medium", "xl", "m", "32w"
+
+    Returns:
+        str: "M", "XL", "32" (waist sizes lose their "w"), or None if not a size
+    """
+    if token in SIZE_KEYWORDS:
+        return SIZE_KEYWORDS[token]
+    if token in ('s', 'm', 'l'):
+        return token.upper()
+    number = _SIZE_NUMBER.fullmatch(token)
+    return number.group(1) if number else None
+
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens
+
+    Args:
+        text (str): Any product or query text
+
+    Returns:
+        list: Word tokens in order of appearance
+    """
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _append_unique(values, value):
+    if value not in values:
+        values.append(value)
+
+
+def parse_price(value):
+    """
+    Convert a price like "$1,299.99", "29.99" or 30 to a float
+
+    Args:
+        value: Price string or number
+
+    Returns:
+        float: The amount, or None if it is not a price
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    cleaned = value.strip().lstrip('$').replace(',', '')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _amount_at(words, index):
+    # Price amount at words[index], or None past the end / for non-numbers
+    if index < len(words) and words[index][:1] in '$0123456789':
+        return parse_price(words[index])
+    return None
+
+
+def parse_query(natural_language_query):
+    """
+    Parse a natural language query in a single pass over the text
+
+    Args:
+        natural_language_query (str): Query like "blue shirts" or "black jeans size 32"
+
+    Returns:
+        ParsedQuery: Detected colors, categories, sizes, modifiers and leftover terms
+    """
+    text = ' '.join((natural_language_query or '').lower().split())
+    found = {'colors': [], 'categories': [], 'sizes': [], 'modifiers': []}
+    tokens = []
+    terms = []
+    min_price = None
+    max_price = None
+
+    words = _TOKEN_PATTERN.findall(text)
+    word_count = len(words)
+    i = 0
+    while i < word_count:
+        word = words[i]
+
+        # "size" followed by any value, e.g. "size m" or "size 32"
+        if word == 'size' and i + 1 < word_count:
+            size_value = words[i + 1]
+            tokens.extend((word, size_value))
+            _append_unique(found['sizes'], canonical_size(size_value) or size_value.upper())
+            i += 2
+            continue
+
+        match = None
+        length = 1
+        for phrase_length in _PHRASE_LENGTHS.get(word, ()):
+            if i + phrase_length <= word_count:
+                match = _KEYWORD_TABLE.get(' '.join(words[i:i + phrase_length]))
+                if match:
+                    length = phrase_length
+                    break
+        if match is None:
+            match = _KEYWORD_TABLE.get(word)
+
+        if match and match[0] == 'price':
+            # "under $30", "over 20", "between $20 and $40"; without an
+            # amount after it the phrase is an ordinary word ("under armour")
+            amount = _amount_at(words, i + length)
+            if amount is None:
+                match = None
+            else:
+                bound = match[1]
+                length += 1
+                if bound == 'between':
+                    separator = i + length < word_count and words[i + length] in ('and', 'to')
+                    upper = _amount_at(words, i + length + 1) if separator else None
+                    min_price = amount
+                    if upper is not None:
+                        max_price = upper
+                        length += 2
+                elif bound == 'max':
+                    max_price = amount
+                else:
+                    min_price = amount
+                i += length
+                continue
+
+        if match:
+            attribute, value = match
+            _append_unique(found[attribute], value)
+            tokens.extend(words[i:i + length])
+        elif word[0] == '$':
+            # Bare amounts: "$20-$40" / "$20 to $40" is a range, "$30" a budget
+            amount = parse_price(word)
+            following = i + 2 if i + 1 < word_count and words[i + 1] == 'to' else i + 1
+            upper = _amount_at(words, following)
+            if upper is not None:
+                min_price, max_price = amount, upper
+                length = following - i + 1
+            else:
+                max_price = amount
+        elif word not in STOP_WORDS:
+            tokens.append(word)
+            terms.append(word)
+        i += length
+
+    return ParsedQuery(
+        text=text,
+        tokens=tuple(tokens),
+        colors=tuple(found['colors']),
+        categories=tuple(found['categories']),
+        sizes=tuple(found['sizes']),
+        modifiers=tuple(found['modifiers']),
+        terms=tuple(terms),
+        min_price=min_price,
+        max_price=max_price
+    )
+
+
+def normalize_product_fields(product):
+    """
+    Compute the canonical lowercase search fields for a product document
+
+    Args:
+        product (dict): Product document with product_title/product_color/product_category
+
+    Returns:
+        dict: color_norm (list), category_norm (str or None), title_tokens (list),
+            size_norm (list) and price_value (float or None)
+    """
+    title = product.get('product_title') or ''
+    color = product.get('product_color') or ''
+    category = product.get('product_category') or ''
+
+    # Prefer the color field; fall back to colors named in the title
+    colors = parse_query(color).colors or parse_query(title).colors
+
+    parsed_category = parse_query(category)
+    if parsed_category.category:
+        category_norm = parsed_category.category.lower()
+    else:
+        category_norm = ' '.join(category.lower().split()) or None
+
+    # Canonical sizes: "Medium" -> M, "X-Large" -> XL, "32W x 30L" -> 32 (waist)
+    size_norm = []
+    for token in tokenize(product.get('product_size') or ''):
+        size = canonical_size(token)
+        if size:
+            _append_unique(size_norm, size)
+
+    return {
+        'color_norm': list(colors),
+        'category_norm': category_norm,
+        'title_tokens': list(dict.fromkeys(tokenize(title))),
+        'size_norm': size_norm,
+        'price_value': parse_price(product.get('product_price'))
+    }
@@ -0,0 +1,31 @@
+"""
+JSON response class for API endpoints
+
+Encodes with orjson when it is installed and converts MongoDB ObjectIds
+during encoding, so endpoints can return documents' ``_id`` values as-is.
+"""
+import json
+from typing import Any
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+
+def _encode_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that serializes with orjson and encodes ObjectId natively"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_encode_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_encode_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
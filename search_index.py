@@ -0,0 +1,436 @@
+"""
+In-process BM25 inverted index over the products collection
+
+The index is built from one projected bulk scan of ``products`` and kept
+fresh in a background thread, either by polling for new ``_id``/``updated_at``
+values or by following a change stream. Searches never touch MongoDB, so
+/search-products can answer read-heavy traffic from memory and fall back to
+query_products while the index is not ready.
+"""
+import heapq
+import logging
+import math
+import sys
+import threading
+import time
+from array import array
+
+from query_parser import normalize_product_fields, tokenize
+from serializers import PRODUCT_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+# Fields kept in memory for each product: the search response fields plus
+# the normalized search fields
+INDEX_PROJECTION = {
+    **PRODUCT_PROJECTION,
+    "color_norm": 1,
+    "category_norm": 1,
+    "title_tokens": 1,
+    "size_norm": 1,
+    "price_value": 1,
+    "updated_at": 1,
+}
+
+_NORMALIZED_FIELDS = ("color_norm", "category_norm", "title_tokens", "size_norm", "price_value")
+
+# Compact the index once this share of slots belongs to replaced/deleted products
+COMPACT_DEAD_RATIO = 0.25
+
+
+class ProductSearchIndex:
+    """
+    BM25-ranked inverted index with exact color/category filtering
+
+    Documents live in numbered slots. Postings are parallel ``array`` columns
+    of (slot, term frequency), so an updated product is appended to a new slot
+    and its old slot is tombstoned until the next compaction.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset()
+
+    def _reset(self):
+        self._docs = []
+        self._doc_lengths = array('H')
+        self._alive = bytearray()
+        self._slot_by_id = {}
+        self._postings = {}
+        self._color_slots = {}
+        self._category_slots = {}
+        self._total_length = 0
+        self._live_count = 0
+        self._impacts = {}
+        self._max_id = None
+        self._max_updated_at = None
+        self.ready = False
+        self.last_refresh = None
+
+    # ------------------------------------------------------------------
+    # Building and maintenance
+    # ------------------------------------------------------------------
+
+    def _add(self, product):
+        product_id = product["_id"]
+        old_slot = self._slot_by_id.get(product_id)
+        if old_slot is not None:
+            self._remove_slot(old_slot)
+
+        if not product.get("title_tokens") or any(field not in product for field in _NORMALIZED_FIELDS):
+            product.update(normalize_product_fields(product))
+
+        # Title tokens only feed the postings; interning shares the strings
+        # between products instead of keeping one copy per document
+        terms = [sys.intern(token) for token in product.pop("title_tokens")]
+        product["color_norm"] = [sys.intern(color) for color in product["color_norm"]]
+        terms.extend(product["color_norm"])
+        if product["category_norm"]:
+            product["category_norm"] = sys.intern(product["category_norm"])
+            terms.extend(tokenize(product["category_norm"]))
+
+        slot = len(self._docs)
+        self._docs.append(product)
+        self._doc_lengths.append(min(len(terms), 0xFFFF))
+        self._alive.append(1)
+        self._slot_by_id[product_id] = slot
+        self._total_length += len(terms)
+        self._live_count += 1
+        self._impacts.clear()
+
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('H'))
+            postings[0].append(slot)
+            postings[1].append(min(frequency, 0xFFFF))
+
+        for color in product["color_norm"]:
+            self._color_slots.setdefault(color, set()).add(slot)
+        if product["category_norm"]:
+            self._category_slots.setdefault(product["category_norm"], set()).add(slot)
+
+        if self._max_id is None or product_id > self._max_id:
+            self._max_id = product_id
+        updated_at = product.get("updated_at")
+        if updated_at is not None and (self._max_updated_at is None or updated_at > self._max_updated_at):
+            self._max_updated_at = updated_at
+
+    def _remove_slot(self, slot):
+        if not self._alive[slot]:
+            return
+        product = self._docs[slot]
+        self._alive[slot] = 0
+        self._docs[slot] = None
+        self._total_length -= self._doc_lengths[slot]
+        self._live_count -= 1
+        self._impacts.clear()
+        for color in product.get("color_norm") or ():
+            self._color_slots.get(color, set()).discard(slot)
+        category = product.get("category_norm")
+        if category:
+            self._category_slots.get(category, set()).discard(slot)
+        if self._slot_by_id.get(product["_id"]) == slot:
+            del self._slot_by_id[product["_id"]]
+
+    def _compact_if_needed(self):
+        dead = len(self._docs) - self._live_count
+        if self._docs and dead / len(self._docs) > COMPACT_DEAD_RATIO:
+            live = [doc for doc in self._docs if doc is not None]
+            # Keep the refresh watermarks even if their products were deleted
+            max_id, max_updated_at, last_refresh = self._max_id, self._max_updated_at, self.last_refresh
+            self._reset()
+            for product in live:
+                self._add(product)
+            self._max_id, self._max_updated_at, self.last_refresh = max_id, max_updated_at, last_refresh
+            self.ready = True
+            logger.info(f"Compacted search index: dropped {dead} dead slots")
+
+    def build(self, collection, batch_size=2000):
+        """
+        Build the index from a full projected scan of the collection
+
+        Args:
+            collection: pymongo Collection holding the products
+            batch_size (int): Cursor batch size for the bulk scan
+
+        Returns:
+            int: Number of indexed products
+        """
+        started = time.perf_counter()
+        cursor = collection.find({}, INDEX_PROJECTION).sort("_id", 1).batch_size(batch_size)
+        count = self.build_from_documents(cursor)
+        logger.info(f"Built search index over {count} products in {time.perf_counter() - started:.2f}s")
+        return count
+
+    def build_from_documents(self, products):
+        """
+        Replace the index contents with the given product documents
+
+        Args:
+            products (iterable): Product documents with at least ``_id``
+
+        Returns:
+            int: Number of indexed products
+        """
+        products = list(products)
+        with self._lock:
+            self._reset()
+            for product in products:
+                self._add(product)
+            self.ready = True
+            self.last_refresh = time.time()
+        return len(products)
+
+    def refresh(self, collection):
+        """
+        Pull products inserted or updated since the last build/refresh
+
+        Args:
+            collection: pymongo Collection holding the products
+
+        Returns:
+            int: Number of products added or replaced
+        """
+        conditions = []
+        if self._max_id is not None:
+            conditions.append({"_id": {"$gt": self._max_id}})
+        if self._max_updated_at is not None:
+            conditions.append({"updated_at": {"$gt": self._max_updated_at}})
+        if not conditions:
+            return self.build(collection)
+
+        products = list(collection.find({"$or": conditions}, INDEX_PROJECTION))
+        if products:
+            with self._lock:
+                for product in products:
+                    self._add(product)
+                self._compact_if_needed()
+            logger.info(f"Search index refreshed with {len(products)} changed products")
+        self.last_refresh = time.time()
+        return len(products)
+
+    def apply_change(self, change):
+        """
+        Apply a single change stream event to the index
+
+        Args:
+            change (dict): Event from collection.watch(full_document="updateLookup")
+        """
+        operation = change.get("operationType")
+        with self._lock:
+            if operation in ("insert", "update", "replace") and change.get("fullDocument"):
+                product = {key: value for key, value in change["fullDocument"].items()
+                           if key == "_id" or key in INDEX_PROJECTION}
+                self._add(product)
+            elif operation == "delete":
+                slot = self._slot_by_id.get(change["documentKey"]["_id"])
+                if slot is not None:
+                    self._remove_slot(slot)
+            self._compact_if_needed()
+        self.last_refresh = time.time()
+
+    # ------------------------------------------------------------------
+    # Background refresh
+    # ------------------------------------------------------------------
+
+    def start(self, collection, mode="poll", interval=30.0):
+        """
+        Build the index and keep it fresh from a daemon thread
+
+        Args:
+            collection: pymongo Collection holding the products
+            mode (str): "poll" to query for new/updated products every interval,
+                "change_stream" to follow collection.watch()
+            interval (float): Poll period in seconds (also the retry delay)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(collection, mode, interval),
+            name="product-search-index", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread"""
+        self._stop.set()
+
+    def _run(self, collection, mode, interval):
+        while not self._stop.is_set():
+            try:
+                if not self.ready:
+                    self.build(collection)
+                if mode == "change_stream":
+                    self._follow_change_stream(collection, interval)
+                else:
+                    self.refresh(collection)
+            except Exception as e:
+                logger.error(f"Search index refresh failed: {e}")
+            self._stop.wait(interval)
+
+    def _follow_change_stream(self, collection, interval):
+        # Catch up on anything missed while the stream was down, then tail it
+        self.refresh(collection)
+        with collection.watch(full_document="updateLookup", max_await_time_ms=int(interval * 1000)) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.apply_change(change)
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def search(self, parsed, limit=10):
+        """
+        Search the index with a parsed natural language query
+
+        Colors, categories, sizes and price bounds detected in the query are
+        exact filters (as in query_products); when none is present every query
+        word must appear.
+        Matches are ranked by BM25 over title, color and category words.
+
+        Args:
+            parsed (ParsedQuery): Output of query_parser.parse_query
+            limit (int): Maximum number of products to return
+
+        Returns:
+            list: Matching product documents, best first
+        """
+        return [product for _, product in self._rank(parsed, limit)]
+
+    def search_page(self, parsed, page_size=10, after=None):
+        """
+        Fetch one keyset-paginated page of search results
+
+        Results are ordered by (score descending, _id ascending); the next
+        page starts strictly after the (score, _id) of the previous page's
+        last product.
+
+        Args:
+            parsed (ParsedQuery): Output of query_parser.parse_query
+            page_size (int): Number of products per page
+            after (tuple, optional): (score, _id) of the last product already returned
+
+        Returns:
+            tuple: (products, next_after) where next_after is None on the last page
+        """
+        ranked = self._rank(parsed, page_size + 1, after)
+        next_after = None
+        if len(ranked) > page_size:
+            ranked = ranked[:page_size]
+            next_after = (ranked[-1][0], ranked[-1][1]["_id"])
+        return [product for _, product in ranked], next_after
+
+    def _rank(self, parsed, limit, after=None):
+        with self._lock:
+            candidates = None
+            if parsed.colors:
+                candidates = set().union(*(self._color_slots.get(color, ()) for color in parsed.colors))
+            if parsed.categories:
+                category_slots = set().union(*(self._category_slots.get(category.lower(), ()) for category in parsed.categories))
+                candidates = category_slots if candidates is None else candidates & category_slots
+            if parsed.sizes or parsed.min_price is not None or parsed.max_price is not None:
+                docs = self._docs
+                pool = candidates if candidates is not None else (slot for slot, live in enumerate(self._alive) if live)
+                candidates = {slot for slot in pool if _matches_attributes(docs[slot], parsed)}
+
+            query_terms = list(dict.fromkeys(parsed.tokens))
+            if candidates is None and (not query_terms or any(term not in self._postings for term in query_terms)):
+                return []
+
+            scores = self._score(query_terms, candidates)
+            docs = self._docs
+            after_key = (-after[0], after[1]) if after is not None else None
+
+            # Rank keys are (-score, _id, slot) so ties break on _id, which
+            # stays stable across compactions unlike slot numbers
+            if candidates is None:
+                required = len(query_terms)
+                ranked = ((-score, docs[slot]["_id"], slot) for slot, (score, matched) in scores.items() if matched == required)
+            else:
+                ranked = ((-score, docs[slot]["_id"], slot) for slot, (score, _) in scores.items())
+            if after_key is not None:
+                ranked = (key for key in ranked if key[:2] > after_key)
+            top = heapq.nsmallest(limit, ranked)
+
+            if candidates is not None and len(top) < limit:
+                # Filter matches that mention no query word rank last, oldest first
+                unscored = ((0.0, docs[slot]["_id"], slot) for slot in candidates if slot not in scores)
+                if after_key is not None:
+                    unscored = (key for key in unscored if key[:2] > after_key)
+                top.extend(heapq.nsmallest(limit - len(top), unscored))
+
+            return [(-negative_score, docs[slot]) for negative_score, _, slot in top]
+
+    def _term_impacts(self, term):
+        # Per-posting BM25 contributions, cached until the next index mutation
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            slots, frequencies = self._postings[term]
+            live_count = self._live_count or 1
+            average_length = (self._total_length / live_count) or 1.0
+            k1, b = self.k1, self.b
+            doc_lengths = self._doc_lengths
+            document_frequency = len(slots)
+            idf = math.log(1 + (live_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            impacts = array('f', (
+                idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * doc_lengths[slot] / average_length))
+                for slot, frequency in zip(slots, frequencies)
+            ))
+            self._impacts[term] = impacts
+        return impacts
+
+    def _score(self, query_terms, candidates):
+        alive = self._alive
+        scores = {}
+        for term in query_terms:
+            if term not in self._postings:
+                continue
+            slots = self._postings[term][0]
+            for slot, impact in zip(slots, self._term_impacts(term)):
+                if not alive[slot] or (candidates is not None and slot not in candidates):
+                    continue
+                score, matched = scores.get(slot, (0.0, 0))
+                scores[slot] = (score + impact, matched + 1)
+        return scores
+
+    def stats(self):
+        """
+        Report index size and freshness
+
+        Returns:
+            dict: Live/total slot counts, vocabulary size and readiness
+        """
+        return {
+            "ready": self.ready,
+            "products": self._live_count,
+            "slots": len(self._docs),
+            "terms": len(self._postings),
+            "last_refresh": self.last_refresh,
+        }
+
+
+def _matches_attributes(product, parsed):
+    # Size and price filters, mirroring the size_norm $in and price_value range in MongoDB
+    if parsed.sizes and not set(parsed.sizes) & set(product.get("size_norm") or ()):
+        return False
+    price = product.get("price_value")
+    if parsed.min_price is not None and (price is None or price < parsed.min_price):
+        return False
+    if parsed.max_price is not None and (price is None or price > parsed.max_price):
+        return False
+    return True
+
+
+# Process-wide index used by the /search-products endpoint
+product_search_index = ProductSearchIndex()
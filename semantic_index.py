@@ -0,0 +1,293 @@
+"""
+Local semantic product search over hashed TF-IDF vectors
+
+Each product's title, category and color are embedded without any external
+service: words and canonical attributes are weighted by IDF and folded into a
+fixed number of dimensions with the signed hashing trick. Queries are
+embedded the same way after expanding occasion words ("beach", "wedding",
+"interview") through a small bundled concept lexicon, so "something for a
+beach wedding" lands near linen shirts and light colors.
+
+Vectors live in one contiguous float32 matrix; top-k is a single
+matrix-vector product plus argpartition. The index is saved as .npy/.json
+files and memory-mapped on load, so restarts do not rebuild it.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from query_parser import normalize_product_fields, parse_query, tokenize, STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIMENSIONS = 256
+INDEX_VERSION = 1
+
+# Occasion/intent words -> product vocabulary they imply (query side only)
+CONCEPT_EXPANSIONS = {
+    'beach': ['linen', 'shorts', 'hawaiian', 'resort', 'summer', 'sleeveless', 'white', 'light'],
+    'wedding': ['formal', 'dress', 'shirt', 'blazer', 'suit', 'linen', 'white', 'navy'],
+    'summer': ['linen', 'shorts', 'short', 'sleeve', 'cotton', 'lightweight', 'white'],
+    'winter': ['wool', 'sweater', 'jacket', 'coat', 'hoodie', 'long', 'sleeve', 'fleece'],
+    'office': ['formal', 'dress', 'shirt', 'oxford', 'chinos', 'trousers', 'blazer', 'button'],
+    'work': ['formal', 'oxford', 'shirt', 'chinos', 'trousers', 'button'],
+    'interview': ['formal', 'oxford', 'shirt', 'blazer', 'trousers', 'navy', 'white'],
+    'business': ['formal', 'oxford', 'shirt', 'blazer', 'chinos', 'trousers'],
+    'party': ['printed', 'graphic', 'slim', 'shirt', 'black'],
+    'date': ['slim', 'shirt', 'polo', 'jeans', 'black', 'navy'],
+    'brunch': ['casual', 'polo', 'linen', 'shorts', 'chinos'],
+    'gym': ['athletic', 'shorts', 'tank', 'hoodie', 'stretch', 'sleeveless'],
+    'workout': ['athletic', 'shorts', 'tank', 'stretch', 'sleeveless'],
+    'hiking': ['cargo', 'shorts', 'jacket', 'stretch', 'lightweight'],
+    'rain': ['jacket', 'coat', 'waterproof', 'hooded'],
+    'cold': ['wool', 'sweater', 'jacket', 'coat', 'fleece', 'hoodie'],
+    'vacation': ['hawaiian', 'resort', 'linen', 'shorts', 'printed'],
+    'lounge': ['hoodie', 'sweatshirt', 'relaxed', 'cotton', 'pullover'],
+}
+
+EXPANSION_WEIGHT = 0.5
+ATTRIBUTE_WEIGHT = 1.5
+
+
+def _product_features(product):
+    # (feature, weight) pairs for a product document
+    fields = normalize_product_fields(product)
+    features = {}
+    text = ' '.join(str(product.get(field) or '') for field in ('product_title', 'product_category', 'product_color'))
+    for token in tokenize(text):
+        if token not in STOP_WORDS:
+            features[token] = features.get(token, 0.0) + 1.0
+    for color in fields['color_norm']:
+        features['color:' + color] = ATTRIBUTE_WEIGHT
+    if fields['category_norm']:
+        features['category:' + fields['category_norm']] = ATTRIBUTE_WEIGHT
+    return features
+
+
+def _query_features(query):
+    parsed = parse_query(query)
+    features = {}
+    for token in parsed.tokens:
+        features[token] = features.get(token, 0.0) + 1.0
+        for expansion in CONCEPT_EXPANSIONS.get(token, ()):
+            features[expansion] = features.get(expansion, 0.0) + EXPANSION_WEIGHT
+    for color in parsed.colors:
+        features['color:' + color] = ATTRIBUTE_WEIGHT
+    for category in parsed.categories:
+        features['category:' + category.lower()] = ATTRIBUTE_WEIGHT
+    return features
+
+
+class SemanticIndex:
+    """
+    Dense float32 vector index with brute-force cosine top-k
+
+    State (matrix, ids, idf) is swapped in as one tuple, so searches never
+    see a half-built index.
+    """
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS):
+        self.dimensions = dimensions
+        self._state = None
+        self._build_lock = threading.Lock()
+        self.built_at = None
+
+    @property
+    def ready(self):
+        return self._state is not None
+
+    def __len__(self):
+        return 0 if self._state is None else len(self._state[1])
+
+    def _embed(self, features, idf, default_idf):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in features.items():
+            digest = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimensions] += sign * weight * idf.get(feature, default_idf)
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector
+
+    def build_from_documents(self, products):
+        """
+        Embed product documents and replace the index contents
+
+        Args:
+            products (iterable): Documents with _id, product_title, product_category, product_color
+
+        Returns:
+            int: Number of indexed products
+        """
+        with self._build_lock:
+            ids = []
+            product_features = []
+            document_frequency = {}
+            for product in products:
+                features = _product_features(product)
+                ids.append(str(product["_id"]))
+                product_features.append(features)
+                for feature in features:
+                    document_frequency[feature] = document_frequency.get(feature, 0) + 1
+
+            count = len(ids)
+            idf = {feature: math.log((count + 1) / (df + 1)) + 1.0 for feature, df in document_frequency.items()}
+            default_idf = math.log(count + 1) + 1.0
+
+            matrix = np.empty((count, self.dimensions), dtype=np.float32)
+            for row, features in enumerate(product_features):
+                matrix[row] = self._embed(features, idf, default_idf)
+
+            self._state = (matrix, ids, {product_id: row for row, product_id in enumerate(ids)}, idf, default_idf)
+            self.built_at = time.time()
+            return count
+
+    def build(self, collection, batch_size=2000):
+        """
+        Build the index from a projected scan of the products collection
+
+        Args:
+            collection: pymongo Collection holding the products
+            batch_size (int): Cursor batch size for the scan
+
+        Returns:
+            int: Number of indexed products
+        """
+        started = time.perf_counter()
+        cursor = collection.find({}, {"product_title": 1, "product_category": 1, "product_color": 1}).batch_size(batch_size)
+        count = self.build_from_documents(cursor)
+        logger.info(f"Built semantic index over {count} products in {time.perf_counter() - started:.2f}s")
+        return count
+
+    def save(self, directory):
+        """
+        Persist the index as vectors.npy plus meta.json
+
+        Args:
+            directory (str): Target directory (created if missing)
+        """
+        matrix, ids, _, idf, default_idf = self._state
+        os.makedirs(directory, exist_ok=True)
+        # Write to temporary names and rename so a crash never leaves a torn index
+        vectors_path = os.path.join(directory, "vectors.npy")
+        meta_path = os.path.join(directory, "meta.json")
+        np.save(vectors_path + ".tmp.npy", np.ascontiguousarray(matrix))
+        with open(meta_path + ".tmp", "w") as meta_file:
+            json.dump({
+                "version": INDEX_VERSION,
+                "dimensions": self.dimensions,
+                "built_at": self.built_at,
+                "ids": ids,
+                "idf": idf,
+                "default_idf": default_idf,
+            }, meta_file)
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def load(self, directory):
+        """
+        Memory-map a saved index
+
+        Args:
+            directory (str): Directory written by save()
+
+        Returns:
+            bool: True if an index was loaded
+        """
+        vectors_path = os.path.join(directory, "vectors.npy")
+        meta_path = os.path.join(directory, "meta.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return False
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != INDEX_VERSION:
+            logger.warning(f"Ignoring semantic index at {directory}: version {meta.get('version')}")
+            return False
+        matrix = np.load(vectors_path, mmap_mode="r")
+        self.dimensions = meta["dimensions"]
+        self.built_at = meta["built_at"]
+        ids = meta["ids"]
+        self._state = (matrix, ids, {product_id: row for row, product_id in enumerate(ids)}, meta["idf"], meta["default_idf"])
+        logger.info(f"Loaded semantic index with {len(ids)} products from {directory}")
+        return True
+
+    def search_page(self, query, page_size=10, after=None):
+        """
+        Rank products by cosine similarity to the query
+
+        Results are ordered by (score descending, row); the next page starts
+        strictly after the (score, product id) of the previous page's last hit.
+
+        Args:
+            query (str): Natural language query
+            page_size (int): Number of hits per page
+            after (tuple, optional): (score, product id) of the last hit already returned
+
+        Returns:
+            tuple: (hits, next_after) where hits are (product id, score) pairs
+                and next_after is None on the last page
+        """
+        state = self._state
+        if state is None:
+            return [], None
+        matrix, ids, row_by_id, idf, default_idf = state
+        if not ids:
+            return [], None
+
+        query_vector = self._embed(_query_features(query), idf, default_idf)
+        scores = np.asarray(matrix @ query_vector, dtype=np.float32)
+
+        # Only products with some similarity are hits
+        eligible = scores > 0
+        if after is not None:
+            after_score = np.float32(after[0])
+            after_row = row_by_id.get(str(after[1]), -1)
+            rows = np.arange(len(ids))
+            eligible &= (scores < after_score) | ((scores == after_score) & (rows > after_row))
+        candidate_rows = np.flatnonzero(eligible)
+        if not len(candidate_rows):
+            return [], None
+
+        wanted = min(page_size + 1, len(candidate_rows))
+        candidate_scores = scores[candidate_rows]
+        cutoff = candidate_scores[np.argpartition(-candidate_scores, wanted - 1)[wanted - 1]]
+        # argpartition breaks ties arbitrarily; take ties at the cutoff by row so pages never skip a hit
+        above = np.flatnonzero(candidate_scores > cutoff)
+        tied = np.flatnonzero(candidate_scores == cutoff)[:wanted - len(above)]
+        top = np.concatenate((above, tied))
+        # Sort by score descending, row ascending for a stable keyset order
+        top = top[np.lexsort((candidate_rows[top], -candidate_scores[top]))]
+        hits = [(ids[candidate_rows[i]], float(candidate_scores[i])) for i in top]
+
+        next_after = None
+        if len(hits) > page_size:
+            hits = hits[:page_size]
+            next_after = (hits[-1][1], hits[-1][0])
+        return hits, next_after
+
+    def stats(self):
+        """
+        Report index size
+
+        Returns:
+            dict: Readiness, product count, dimensions and matrix bytes
+        """
+        matrix = self._state[0] if self._state else None
+        return {
+            "ready": self.ready,
+            "products": len(self),
+            "dimensions": self.dimensions,
+            "matrix_bytes": int(matrix.nbytes) if matrix is not None else 0,
+            "built_at": self.built_at,
+        }
+
+
+# Process-wide index used by /search-products in semantic mode
+semantic_index = SemanticIndex(dimensions=int(os.getenv("SEMANTIC_INDEX_DIMENSIONS", DEFAULT_DIMENSIONS)))
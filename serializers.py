@@ -0,0 +1,105 @@
+"""
+Response shapes for products and closet items
+
+Each shape is a field spec: (output field, source fields tried in order,
+default). The same spec produces the MongoDB projection, so a query only
+pulls the fields its response needs, and the serializer that maps a
+document straight to its response dict.
+"""
+
+# Products collection -> /search-products
+PRODUCT_FIELDS = (
+    ("id", ("_id",), ""),
+    ("product_title", ("product_title",), "N/A"),
+    ("product_name", ("product_title",), "N/A"),  # Alias for compatibility
+    ("product_url", ("product_url",), ""),
+    ("product_price", ("product_price",), "N/A"),
+    ("product_color", ("product_color",), "N/A"),
+    ("product_size", ("product_size",), "N/A"),
+    ("product_category", ("product_category",), "N/A"),
+    ("image_url", ("image_url",), ""),
+    # Legacy compatibility fields
+    ("price", ("product_price",), "N/A"),
+    ("category", ("product_category",), "N/A"),
+)
+
+# Closets collection -> /closet-items and outfit suggestions (handles old and new schema)
+CLOSET_ITEM_FIELDS = (
+    ("id", ("_id",), ""),
+    ("product_title", ("product_title", "product_name", "title"), "N/A"),
+    ("product_name", ("product_title", "product_name", "title"), "N/A"),
+    ("product_price", ("product_price", "metadata.price"), "N/A"),
+    ("product_color", ("product_color", "colors.primary"), "N/A"),
+    ("product_category", ("product_category", "category"), "N/A"),
+    ("product_size", ("product_size",), "N/A"),
+    ("image_url", ("image_url",), ""),
+    ("product_url", ("product_url",), ""),
+    # Legacy fields for compatibility
+    ("price", ("product_price", "metadata.price"), "N/A"),
+)
+
+
+def projection(fields):
+    """
+    Build the MongoDB projection that covers a field spec
+
+    Args:
+        fields (tuple): Field spec such as PRODUCT_FIELDS
+
+    Returns:
+        dict: Projection including every source field (dotted paths allowed)
+    """
+    return {source: 1 for _, sources, _ in fields for source in sources}
+
+
+def _get(doc, path, default):
+    for part in path[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return default
+    return doc.get(path[-1], default)
+
+
+def make_serializer(fields):
+    """
+    Turn a field spec into a document -> response dict function
+
+    Sources follow the hand-written dicts the spec replaced: earlier sources
+    are fallbacks taken only when truthy, and the last one is read with
+    .get(key, default), so a stored empty or zero value is returned as is
+    and only a missing field falls back to the default. Values are passed
+    through untouched (ObjectIds included) for the JSON response class to
+    encode.
+
+    Args:
+        fields (tuple): Field spec such as PRODUCT_FIELDS
+
+    Returns:
+        callable: serialize(doc) -> dict
+    """
+    # (output field, fallback paths, last path, default); dotted sources are split once
+    entries = [
+        (name, tuple(tuple(source.split(".")) for source in sources[:-1]), tuple(sources[-1].split(".")), default)
+        for name, sources, default in fields
+    ]
+
+    def serialize(doc):
+        result = {}
+        for name, fallbacks, last, default in entries:
+            for path in fallbacks:
+                value = _get(doc, path, None)
+                if value:
+                    break
+            else:
+                value = _get(doc, last, default)
+            result[name] = value
+        return result
+
+    return serialize
+
+
+PRODUCT_PROJECTION = projection(PRODUCT_FIELDS)
+CLOSET_ITEM_PROJECTION = projection(CLOSET_ITEM_FIELDS)
+
+serialize_product = make_serializer(PRODUCT_FIELDS)
+serialize_closet_item = make_serializer(CLOSET_ITEM_FIELDS)
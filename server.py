@@ -1,34 +1,37 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Header, Depends
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from google import genai
-from google.genai import types
-from PIL import Image
 from io import BytesIO
-from typing import Optional, Dict, Any
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from pydantic import BaseModel
-from mongo_search import query_products, add_to_closet, add_product_to_closet, get_all_closet_items, clear_closets_collection, get_outfit_suggestions_with_llm
+from typing import Optional, Dict, Any, List, Literal
+from pydantic import BaseModel, Field
+from mongo_search import get_db, get_title_vocabulary, encode_search_cursor, decode_search_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_BATCH_QUERIES, DEFAULT_CLOSET_PAGE_SIZE, MAX_CLOSET_PAGE_SIZE, DEFAULT_USER_ID, MAX_CLOSET_BATCH_SIZE, product_search_cache, product_facets_cache, closet_summary_cache, outfit_response_cache
+from mongo_async import search_products_page_async, search_products_batch_async, get_products_by_ids_async, add_product_to_closet_async, add_products_to_closet_async, get_closet_items_page_async, get_closet_summary_async, get_outfit_suggestions_with_llm_async, start_closet_clear, wait_for_closet_clears, ensure_closet_indexes_async, close_async_client, warm_up, current_readiness, closet_write_buffer
+from closet_writer import CLOSET_WRITE_BUFFER_ENABLED, write_buffer_collector
+from llm_client import get_genai_client, get_async_genai_client, close_genai_client
+from query_parser import parse_query, tokenize
+from search_index import product_search_index
+from semantic_index import semantic_index, CONCEPT_EXPANSIONS
+from spelling import spelling_corrector, correct_query, KEYWORD_COUNT
+from serializers import CLOSET_ITEM_PROJECTION, serialize_product, serialize_closet_item
+from responses import FastJSONResponse
+from timing import REQUEST_TIMING_ENABLED, ServerTimingMiddleware, span
+from metrics import METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, register_collector, cache_collector, render as render_metrics
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+import asyncio
 import re
 import os
-import uvicorn
-import requests
 import time
 import random
-import boto3
 import uuid
 import logging
+import threading
 from datetime import datetime
+from contextlib import asynccontextmanager
 
 # Configure logging
 logging.basicConfig(
@@ -44,10 +47,29 @@ logger = logging.getLogger(__name__)
 # Pydantic models for JSON request validation
 class SearchProductsRequest(BaseModel):
     query: str
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None  # next_cursor from the previous page
+    mode: Literal["keyword", "semantic"] = "keyword"
+    facets: bool = False  # Include color/category counts over all matches
+
+class SearchProductsBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+
+def closet_user_id(x_user_id: Optional[str] = Header(None, min_length=1, max_length=128, pattern=r"^[A-Za-z0-9._:@-]+$")) -> str:
+    """
+    Owner of the closet a request works on, from the X-User-Id header
+
+    Requests without the header share the DEFAULT_CLOSET_USER_ID closet.
+    """
+    return x_user_id or DEFAULT_USER_ID
 
 class AddToClosetRequest(BaseModel):
     product_id: str
 
+class AddToClosetBatchRequest(BaseModel):
+    product_ids: List[str] = Field(..., min_length=1, max_length=MAX_CLOSET_BATCH_SIZE)
+
 class OutfitSuggestionsRequest(BaseModel):
     query: str
 
@@ -59,11 +81,86 @@ MODEL_IMAGE_PATH = "new_m_p.jpg"  # Replace with your model image path
 IMAGE_GENERATION_MODEL = os.getenv('IMAGE_GENERATION_MODEL')  # Replace with your desired model
 S3_BUCKET_NAME = os.getenv('S3_BUCKET')
 
+# Optional in-memory product search index (see search_index.py)
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SEARCH_INDEX_REFRESH_MODE = os.getenv('SEARCH_INDEX_REFRESH_MODE', 'poll')  # "poll" or "change_stream"
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '30'))
+
+# Optional local semantic search (see semantic_index.py)
+SEMANTIC_INDEX_ENABLED = os.getenv('SEMANTIC_INDEX_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SEMANTIC_INDEX_PATH = os.getenv('SEMANTIC_INDEX_PATH', 'semantic_index_data')
+
+# Queries are corrected only once the catalog title words are loaded; a failed load is retried
+SPELLING_VOCABULARY_RETRY_SECONDS = float(os.getenv('SPELLING_VOCABULARY_RETRY_SECONDS', '30'))
+
 logger.info("Initializing Fashion Fitter API...")
 logger.info(f"IMAGE_GENERATION_MODEL: {IMAGE_GENERATION_MODEL}")
 logger.info(f"S3_BUCKET_NAME: {S3_BUCKET_NAME}")
 
-app = FastAPI(title="Fashion Fitter API", description="API to generate fashion photos by combining dress and model images")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open pool connections before the first request instead of during it
+    await warm_up()
+    # Not awaited: with MongoDB unreachable this would wait for server selection
+    closet_indexes_task = asyncio.create_task(ensure_closet_indexes_in_background())
+    if CLOSET_WRITE_BUFFER_ENABLED:
+        closet_write_buffer.start()
+
+    # Closets are kept across restarts; old items are reaped by the expires_at TTL index
+    logger.info("🚀 Starting Fashion Fitter API...")
+
+    if SEARCH_INDEX_ENABLED:
+        # Built in the background; searches use MongoDB until the index is ready
+        logger.info(f"Starting product search index (refresh mode: {SEARCH_INDEX_REFRESH_MODE})")
+        product_search_index.start(get_db()["products"], mode=SEARCH_INDEX_REFRESH_MODE, interval=SEARCH_INDEX_REFRESH_SECONDS)
+    threading.Thread(target=load_spelling_vocabulary, name="spelling-vocabulary", daemon=True).start()
+    if SEMANTIC_INDEX_ENABLED and not semantic_index.load(SEMANTIC_INDEX_PATH):
+        # No saved index yet: build one in the background and persist it for the next start
+        threading.Thread(target=build_semantic_index, name="semantic-index-build", daemon=True).start()
+    if PRELOAD_HEAVY_MODULES:
+        threading.Thread(target=warm_up_heavy_modules, name="heavy-module-preload", daemon=True).start()
+    yield
+    closet_indexes_task.cancel()
+    product_search_index.stop()
+    # Flush queued closet adds while the client is still open
+    await closet_write_buffer.stop()
+    await wait_for_closet_clears()
+    await close_genai_client()
+    outfit_response_cache.close()
+    await close_async_client()
+
+async def ensure_closet_indexes_in_background():
+    try:
+        await ensure_closet_indexes_async()
+    except Exception as e:
+        logger.warning(f"Failed to ensure closet indexes: {e}")
+
+def load_spelling_vocabulary():
+    while True:
+        try:
+            vocabulary = get_title_vocabulary()
+            if vocabulary:
+                spelling_corrector.add_words(vocabulary)
+                spelling_corrector.ready = True
+                logger.info(f"Loaded {len(vocabulary)} catalog words into the spelling dictionary")
+                return
+            # No title_tokens yet (backfill has not run); keyword words alone would correct real words
+            logger.warning(f"No catalog words for spelling correction yet, retrying in {SPELLING_VOCABULARY_RETRY_SECONDS:g}s")
+        except Exception as e:
+            logger.warning(f"Failed to load catalog vocabulary for spelling correction, retrying in {SPELLING_VOCABULARY_RETRY_SECONDS:g}s: {e}")
+        time.sleep(SPELLING_VOCABULARY_RETRY_SECONDS)
+
+# Occasion words understood by semantic search are valid query words too
+spelling_corrector.add_words(CONCEPT_EXPANSIONS.keys(), count=KEYWORD_COUNT)
+
+def build_semantic_index():
+    try:
+        semantic_index.build(get_db()["products"])
+        semantic_index.save(SEMANTIC_INDEX_PATH)
+    except Exception as e:
+        logger.error(f"Failed to build semantic index: {e}", exc_info=True)
+
+app = FastAPI(title="Fashion Fitter API", description="API to generate fashion photos by combining dress and model images", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -72,29 +169,53 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if REQUEST_TIMING_ENABLED:
+    # Server-Timing header and one timing log line per request (see timing.py)
+    app.add_middleware(ServerTimingMiddleware)
+if METRICS_ENABLED:
+    # Request counts and latency per route for /metrics
+    app.add_middleware(MetricsMiddleware)
+    register_collector(cache_collector({"product_search": product_search_cache, "product_facets": product_facets_cache, "closet_summary": closet_summary_cache, "outfit_suggestions": outfit_response_cache}))
+    register_collector(write_buffer_collector(closet_write_buffer))
 # Initialize Google Gemini client with API key
 api_key = os.getenv('GOOGLE_API_KEY')
 if not api_key:
     logger.error("GOOGLE_API_KEY environment variable is missing!")
     raise ValueError("GOOGLE_API_KEY environment variable is required. Please set your Google AI Studio API key.")
 
-logger.info("Initializing Google Gemini client...")
-client = genai.Client(api_key=api_key)
-logger.info("Google Gemini client initialized successfully")
+# Heavy SDKs (Gemini, Selenium, BeautifulSoup, Pillow, boto3) are imported on
+# first use or by warm_up_heavy_modules(), so workers that only serve search
+# boot without them
+PRELOAD_HEAVY_MODULES = os.getenv('PRELOAD_HEAVY_MODULES', 'true').lower() in ('1', 'true', 'yes')
 
-# Clear closets collection on startup
-logger.info("🚀 Starting Fashion Fitter API...")
-logger.info("Clearing closets collection on startup...")
-clear_result = clear_closets_collection()
-if clear_result["success"]:
-    logger.info(f"✅ Startup: {clear_result['message']} ({clear_result['deleted_count']} items removed)")
-else:
-    logger.warning(f"⚠️ Startup warning: {clear_result['message']}")
+def warm_up_heavy_modules():
+    """
+    Import the SDKs used by photo generation and outfit suggestions in the
+    background, so the first such request does not pay for them
+    """
+    started = time.perf_counter()
+    try:
+        import PIL.Image  # noqa: F401
+        import bs4  # noqa: F401
+        import boto3  # noqa: F401
+        import requests  # noqa: F401
+        import selenium.webdriver  # noqa: F401
+        import webdriver_manager.chrome  # noqa: F401
+        get_genai_client()
+        logger.info(f"Preloaded heavy modules in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.warning(f"Failed to preload heavy modules: {e}")
 
 def scrape_amazon_product(url):
     """
     Scrapes Amazon product details including title, size, category, color, price, images, and URL
     """
+    from bs4 import BeautifulSoup
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+
     logger.info(f"Starting Amazon product scraping for URL: {url}")
 
     # Setup Chrome options
@@ -112,21 +233,24 @@ def scrape_amazon_product(url):
     chrome_options.binary_location = chrome_bin  # e.g. '/usr/bin/google-chrome' or '/usr/bin/chromium-browser'
 
     # Initialize the driver
-    try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-    except Exception as e:
-        logger.warning(f"Failed to initialize Chrome driver with {chrome_bin}: {e}")
-        logger.info("Trying alternative approach with chromium-browser...")
-        chrome_options.binary_location = '/usr/bin/chromium-browser'
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+    with span("browser-launch"):
+        try:
+            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+        except Exception as e:
+            logger.warning(f"Failed to initialize Chrome driver with {chrome_bin}: {e}")
+            logger.info("Trying alternative approach with chromium-browser...")
+            chrome_options.binary_location = '/usr/bin/chromium-browser'
+            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
 
     try:
         # Load the page
-        driver.get(url)
-        time.sleep(3)  # Wait for page to load
+        with span("page-load"):
+            driver.get(url)
+            time.sleep(3)  # Wait for page to load
 
         # Get page source and parse with BeautifulSoup
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        with span("html-parse"):
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
 
         # Initialize product data dictionary
         product_data = {
@@ -238,7 +362,8 @@ def scrape_amazon_product(url):
         return None
     finally:
         try:
-            driver.quit()
+            with span("browser-quit"):
+                driver.quit()
         except Exception:
             pass
 
@@ -250,10 +375,14 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
     """
     url = request.url
     prompt = request.prompt
+    import requests
+    from PIL import Image
+
     logger.info(f"Starting photo generation request for URL: {url}")
     logger.debug(f"Custom prompt provided: {prompt[:100]}...")
 
-    scraped = scrape_amazon_product(url)
+    with span("scrape"):
+        scraped = scrape_amazon_product(url)
     if not scraped:
         logger.error("Failed to scrape product data")
         raise HTTPException(status_code=400, detail="Failed to scrape product data from the provided URL")
@@ -278,9 +407,10 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
     # Download the dress image from the URL
     try:
         logger.info("Downloading dress image from URL...")
-        dress_response = requests.get(dress_image_url)
-        dress_response.raise_for_status()
-        dress_pil = Image.open(BytesIO(dress_response.content))
+        with span("image-download"):
+            dress_response = requests.get(dress_image_url)
+            dress_response.raise_for_status()
+            dress_pil = Image.open(BytesIO(dress_response.content))
         logger.info(f"Successfully downloaded dress image - Size: {dress_pil.size}")
     except Exception as e:
         logger.error(f"Failed to download dress image: {str(e)}")
@@ -289,9 +419,9 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
     # Load the local model image
     try:
         logger.info(f"Loading model image from: {MODEL_IMAGE_PATH}")
-        with open(MODEL_IMAGE_PATH, 'rb') as model_file:
+        with span("model-image"), open(MODEL_IMAGE_PATH, 'rb') as model_file:
             model_bytes = model_file.read()
-        model_pil = Image.open(BytesIO(model_bytes))
+            model_pil = Image.open(BytesIO(model_bytes))
         logger.info(f"Successfully loaded model image - Size: {model_pil.size}")
     except Exception as e:
         logger.error(f"Failed to load model image: {str(e)}")
@@ -301,10 +431,11 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
         logger.info("Starting image generation with Google Gemini...")
         logger.debug(f"Using model: {IMAGE_GENERATION_MODEL}")
 
-        response = client.models.generate_content(
-            model=IMAGE_GENERATION_MODEL,
-            contents=[dress_pil, model_pil, prompt],
-        )
+        with span("gemini"):
+            response = await get_async_genai_client().models.generate_content(
+                model=IMAGE_GENERATION_MODEL,
+                contents=[dress_pil, model_pil, prompt],
+            )
 
         image_parts = [
             part.inline_data.data
@@ -317,24 +448,27 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
             raise HTTPException(status_code=500, detail="No image generated from the model")
 
         logger.info("Successfully generated image from Gemini")
-        generated_image = Image.open(BytesIO(image_parts[0]))
-        logger.info(f"Generated image size: {generated_image.size}")
+        with span("png-encode"):
+            generated_image = Image.open(BytesIO(image_parts[0]))
+            logger.info(f"Generated image size: {generated_image.size}")
 
-        # Convert PIL image to buffer for S3 upload
-        buffer = BytesIO()
-        generated_image.save(buffer, format='PNG')
+            # Convert PIL image to buffer for S3 upload
+            buffer = BytesIO()
+            generated_image.save(buffer, format='PNG')
         logger.debug("Image converted to PNG buffer")
 
         # Upload image to S3 and make it publicly accessible
         logger.info("Uploading image to S3...")
+        import boto3
         s3_client = boto3.client("s3")
         bucket_name = S3_BUCKET_NAME
         s3_key = f"generated_images/{uuid.uuid4()}.png"
         logger.debug(f"S3 upload - Bucket: {bucket_name}, Key: {s3_key}")
 
         buffer.seek(0)
-        s3_client.upload_fileobj(buffer, bucket_name, s3_key, ExtraArgs={'ContentType': 'image/png'})
-        image_url = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': s3_key}, ExpiresIn=3600)  # 1 hour expiry
+        with span("s3-upload"):
+            s3_client.upload_fileobj(buffer, bucket_name, s3_key, ExtraArgs={'ContentType': 'image/png'})
+            image_url = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': s3_key}, ExpiresIn=3600)  # 1 hour expiry
         logger.info(f"Successfully uploaded image to S3: {s3_key}")
 
         logger.info("Photo generation completed successfully")
@@ -349,16 +483,71 @@ async def generate_photo_and_data(request: PhotoGenerationRequest):
         logger.error(f"Error generating fashion photo: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error generating fashion photo: {str(e)}")
 
+async def find_products_page(query, page_size, cursor=None, facets=False):
+    """
+    Fetch one page of search results from the in-memory index when it is
+    ready, otherwise from MongoDB
+
+    Args:
+        query (str): Natural language search query
+        page_size (int): Number of products per page
+        cursor (dict, optional): Decoded cursor from the previous page
+        facets (bool): Also return color/category counts (always computed by MongoDB)
+
+    Returns:
+        tuple: (products, next_cursor, facets) where next_cursor is None on the
+            last page and facets is None unless requested
+    """
+    # A cursor keeps paging on the engine that produced it
+    if not facets and product_search_index.ready and (cursor is None or cursor["source"] == "index"):
+        try:
+            logger.info(f"Searching products in memory index for query: '{query}'")
+            after = (cursor["sort_value"], cursor["last_id"]) if cursor else None
+            with span("index-search"):
+                products, next_after = product_search_index.search_page(parse_query(query), page_size, after)
+            next_cursor = encode_search_cursor("index", *next_after) if next_after else None
+            return products, next_cursor, None
+        except Exception as e:
+            logger.warning(f"Search index lookup failed, falling back to MongoDB: {e}")
+
+    # Call the MongoDB query function
+    logger.info(f"Searching products in MongoDB for query: '{query}'")
+    if cursor is not None and cursor["source"] == "index":
+        # Index cursors hold a score, not a MongoDB sort key; restart from the first page
+        cursor = None
+    page = await search_products_page_async(query, page_size=page_size, cursor=cursor, facets=facets)
+    return page["products"], page["next_cursor"], page.get("facets")
+
+async def find_semantic_products_page(query, page_size, cursor=None):
+    """
+    Fetch one page of products ranked by semantic similarity to the query
+
+    Args:
+        query (str): Natural language search query
+        page_size (int): Number of products per page
+        cursor (dict, optional): Decoded cursor from the previous semantic page
+
+    Returns:
+        tuple: (products, next_cursor) where next_cursor is None on the last page
+    """
+    logger.info(f"Searching products in semantic index for query: '{query}'")
+    after = (cursor["sort_value"], cursor["last_id"]) if cursor else None
+    with span("semantic-search"):
+        hits, next_after = semantic_index.search_page(query, page_size, after)
+    products = await get_products_by_ids_async([product_id for product_id, _ in hits])
+    next_cursor = encode_search_cursor("semantic", *next_after) if next_after else None
+    return products, next_cursor
+
 @app.post("/search-products")
 async def search_products_endpoint(request: SearchProductsRequest):
     """
     Search products using natural language query
 
     Args:
-        request: JSON request containing query string
+        request: JSON request containing query string, optional page_size and cursor
 
     Returns:
-        JSON response with matching products (max 10)
+        JSON response with one page of matching products and the cursor for the next page
     """
     query = request.query
     logger.info(f"Product search request received - Query: '{query}'")
@@ -367,50 +556,121 @@ async def search_products_endpoint(request: SearchProductsRequest):
             logger.warning("Empty or invalid query provided")
             raise HTTPException(status_code=400, detail="Query parameter is required and cannot be empty")
 
-        # Call the MongoDB query function
-        logger.info(f"Searching products in MongoDB for query: '{query.strip()}'")
-        results = query_products(query.strip())
+        try:
+            cursor = decode_search_cursor(request.cursor) if request.cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if cursor is not None and (cursor["source"] == "semantic") != (request.mode == "semantic"):
+            raise HTTPException(status_code=400, detail="Pagination cursor does not match the search mode")
+
+        facets = None
+        # Fix typos ("jakcet" -> "jacket") before any engine sees the query
+        with span("spelling"):
+            search_query = correct_query(query)
+        corrected_query = search_query if search_query != ' '.join(tokenize(query)) else None
+        if corrected_query:
+            logger.info(f"Corrected query '{query}' to '{corrected_query}'")
+
+        if request.mode == "semantic":
+            if request.facets:
+                raise HTTPException(status_code=400, detail="Facets are only available in keyword mode")
+            if not semantic_index.ready:
+                raise HTTPException(status_code=503, detail="Semantic search index is not available")
+            results, next_cursor = await find_semantic_products_page(search_query, request.page_size, cursor)
+        else:
+            results, next_cursor, facets = await find_products_page(search_query, request.page_size, cursor, facets=request.facets)
         logger.info(f"Found {len(results)} products matching the query")
 
-        # Format the response
-        formatted_results = []
-        for product in results:
-            # Handle new schema with direct fields
-            formatted_product = {
-                "id": str(product.get("_id", "")),
-                "product_title": product.get("product_title", "N/A"),
-                "product_name": product.get("product_title", "N/A"),  # Alias for compatibility
-                "product_url": product.get("product_url", ""),
-                "product_price": product.get("product_price", "N/A"),
-                "product_color": product.get("product_color", "N/A"),
-                "product_size": product.get("product_size", "N/A"),
-                "product_category": product.get("product_category", "N/A"),
-                "image_url": product.get("image_url", ""),
-                # Legacy compatibility fields
-                "price": product.get("product_price", "N/A"),
-                "category": product.get("product_category", "N/A")
-            }
-            formatted_results.append(formatted_product)
+        # Format the response straight from the shared field spec
+        with span("serialize"):
+            formatted_results = [serialize_product(product) for product in results]
 
         logger.info(f"Successfully formatted {len(formatted_results)} products for response")
-        return JSONResponse(content={
+        response = {
             "success": True,
             "query": query,
+            "corrected_query": corrected_query,
+            "mode": request.mode,
             "total_results": len(results),
-            "products": formatted_results
-        })
+            "products": formatted_results,
+            "page_size": request.page_size,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }
+        if request.facets:
+            response["facets"] = facets
+        return FastJSONResponse(content=response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error searching products: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error searching products: {str(e)}")
 
+@app.post("/search-products/batch")
+async def search_products_batch_endpoint(request: SearchProductsBatchRequest):
+    """
+    Search products for several natural language queries in one request
+
+    Duplicate queries are answered once; the rest are served from the in-memory
+    index when it is ready, otherwise by a single MongoDB aggregation.
+
+    Args:
+        request: JSON request containing the list of queries and optional page_size
+
+    Returns:
+        JSON response with the first page of products for each query, in request order
+    """
+    queries = [query.strip() for query in request.queries]
+    logger.info(f"Batch product search request received - {len(queries)} queries")
+    if not all(queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+
+    try:
+        with span("spelling"):
+            search_queries = [correct_query(query) for query in queries]
+        if product_search_index.ready:
+            pages_by_key = {}
+            pages = []
+            with span("index-search"):
+                for query in search_queries:
+                    parsed = parse_query(query)
+                    if parsed.cache_key not in pages_by_key:
+                        products, next_after = product_search_index.search_page(parsed, request.page_size)
+                        pages_by_key[parsed.cache_key] = {"products": products, "next_cursor": encode_search_cursor("index", *next_after) if next_after else None}
+                    pages.append(pages_by_key[parsed.cache_key])
+        else:
+            pages = await search_products_batch_async(search_queries, page_size=request.page_size)
+
+        return FastJSONResponse(content={
+            "success": True,
+            "page_size": request.page_size,
+            "results": [
+                {
+                    "query": query,
+                    "corrected_query": search_query if search_query != ' '.join(tokenize(query)) else None,
+                    "total_results": len(page["products"]),
+                    "products": [serialize_product(product) for product in page["products"]],
+                    "has_more": page["next_cursor"] is not None,
+                    "next_cursor": page["next_cursor"]
+                }
+                for query, search_query, page in zip(request.queries, search_queries, pages)
+            ]
+        })
+
+    except Exception as e:
+        logger.error(f"Error batch searching products: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error searching products: {str(e)}")
+
 @app.post("/add-to-closet")
-async def add_to_closet_endpoint(request: AddToClosetRequest):
+async def add_to_closet_endpoint(request: AddToClosetRequest, user_id: str = Depends(closet_user_id)):
     """
-    Add a product to the closet collection using product ID
+    Add a product to the user's closet using product ID
     
     Args:
         request: JSON request containing product_id
+        user_id: Closet owner from the X-User-Id header
         
     Returns:
         JSON response with insertion confirmation
@@ -421,7 +681,7 @@ async def add_to_closet_endpoint(request: AddToClosetRequest):
             raise HTTPException(status_code=400, detail="Product ID is required")
         
         # Call the simplified MongoDB add function
-        result_id = add_product_to_closet(product_id.strip())
+        result_id = await add_product_to_closet_async(product_id.strip(), user_id=user_id)
         
         if result_id:
             return JSONResponse(content={
@@ -438,86 +698,131 @@ async def add_to_closet_endpoint(request: AddToClosetRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding product to closet: {str(e)}")
 
+@app.post("/add-to-closet/batch")
+async def add_to_closet_batch_endpoint(request: AddToClosetBatchRequest, user_id: str = Depends(closet_user_id)):
+    """
+    Add several products to the user's closet in one request
+
+    All products are fetched with one MongoDB query and upserted with one
+    unordered bulk_write, so an invalid or missing ID only fails its own
+    entry. Adding is idempotent: a product already in the closet is not
+    duplicated, and its result has created: false and the existing item's
+    mongodb_id.
+
+    Args:
+        request: JSON request containing the list of product_ids
+        user_id: Closet owner from the X-User-Id header
+
+    Returns:
+        JSON response with one result per product ID, in request order
+    """
+    product_ids = [product_id.strip() for product_id in request.product_ids]
+    logger.info(f"Batch add-to-closet request received - {len(product_ids)} products")
+    try:
+        results = await add_products_to_closet_async(product_ids, user_id=user_id)
+        added_count = sum(1 for result in results if result["success"])
+        return FastJSONResponse(content={
+            "success": added_count == len(results),
+            "added_count": added_count,
+            "failed_count": len(results) - added_count,
+            "results": results
+        })
+
+    except Exception as e:
+        logger.error(f"Error batch adding products to closet: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error adding products to closet: {str(e)}")
+
+@app.get("/closet-summary")
+async def get_closet_summary_endpoint(user_id: str = Depends(closet_user_id)):
+    """
+    Summarize the user's closet: item counts by type, category and color, and the newest items
+
+    Computed by one aggregation and cached until the closet changes
+
+    Returns:
+        JSON response with total_items, type_counts, category_counts, color_counts and recent_items
+    """
+    try:
+        summary = await get_closet_summary_async(user_id)
+        return FastJSONResponse(content={"success": True, **summary})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error summarizing closet: {str(e)}")
+
 @app.get("/closet-items")
 async def get_closet_items_endpoint(
-    limit: Optional[int] = None
+    limit: int = Query(DEFAULT_CLOSET_PAGE_SIZE, ge=1, le=MAX_CLOSET_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_count: bool = False,
+    user_id: str = Depends(closet_user_id)
 ):
     """
-    Get all items from the closets collection
+    Get one page of items from the closets collection
 
     Args:
-        limit (int, optional): Limit the number of results returned
+        limit (int): Number of items per page
+        cursor (str, optional): next_cursor from the previous page
+        include_count (bool): Also return the number of items in the whole closet
+        user_id (str): Closet owner from the X-User-Id header
 
     Returns:
-        JSON response with closet items
+        JSON response with closet items and the cursor for the next page
     """
     try:
-        # Call the MongoDB function to get closet items
-        closet_items = get_all_closet_items(limit=limit)
+        decoded_cursor = decode_search_cursor(cursor) if cursor else None
+        if decoded_cursor is not None and decoded_cursor["source"] != "closet":
+            raise ValueError("Invalid pagination cursor")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # One projected, keyset-paginated query (plus the count when asked)
+        page = await get_closet_items_page_async(limit, decoded_cursor, CLOSET_ITEM_PROJECTION, include_count, user_id=user_id)
+        closet_items = page["items"]
 
         # Format the response with only essential data
-        formatted_items = []
-        for item in closet_items:
-            formatted_item = {
-                "id": str(item.get("_id", "")),
-                "product_title": item.get("product_title") or item.get("product_name") or item.get("title", "N/A"),
-                "product_name": item.get("product_title") or item.get("product_name") or item.get("title", "N/A"),
-                "product_price": item.get("product_price") or item.get("metadata", {}).get("price", "N/A"),
-                "product_color": item.get("product_color") or item.get("colors", {}).get("primary", "N/A"),
-                "product_category": item.get("product_category") or item.get("category", "N/A"),
-                "product_size": item.get("product_size", "N/A"),
-                "image_url": item.get("image_url", ""),
-                "product_url": item.get("product_url", ""),
-                # Legacy fields for compatibility
-                "price": item.get("product_price") or item.get("metadata", {}).get("price", "N/A")
-            }
-            formatted_items.append(formatted_item)
+        formatted_items = [serialize_closet_item(item) for item in closet_items]
 
-        return JSONResponse(content={
+        response = {
             "success": True,
             "total_items": len(closet_items),
             "limit_applied": limit,
-            "closet_items": formatted_items
-        })
+            "closet_items": formatted_items,
+            "has_more": page["next_cursor"] is not None,
+            "next_cursor": page["next_cursor"]
+        }
+        if include_count:
+            response["total_count"] = page["total_count"]
+        return FastJSONResponse(content=response)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving closet items: {str(e)}")
 
-@app.delete("/closet-items")
-async def clear_closet_items_endpoint():
+@app.delete("/closet-items", status_code=202)
+async def clear_closet_items_endpoint(user_id: str = Depends(closet_user_id)):
     """
-    Clear all items from the closets collection
+    Clear all items from the user's closet
+
+    The items are deleted by a background task, so the response does not
+    wait for them; a DELETE while the user's clear is running joins it.
 
     Returns:
-        JSON response with clear operation results
+        JSON response (202) saying whether a clear was started
     """
-    try:
-        # Call the MongoDB clear function
-        result = clear_closets_collection()
-
-        if result["success"]:
-            return JSONResponse(content={
-                "success": True,
-                "message": result["message"],
-                "deleted_count": result["deleted_count"],
-                "initial_count": result.get("initial_count", 0),
-                "final_count": result.get("final_count", 0)
-            })
-        else:
-            raise HTTPException(status_code=500, detail=result["message"])
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error clearing closet items: {str(e)}")
+    started = start_closet_clear(user_id)
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "message": "Closet clearing started" if started else "Closet clearing already in progress",
+        "user_id": user_id
+    })
 
 @app.post("/outfit-suggestions")
-async def get_outfit_suggestions_endpoint(request: OutfitSuggestionsRequest):
+async def get_outfit_suggestions_endpoint(request: OutfitSuggestionsRequest, user_id: str = Depends(closet_user_id)):
     """
     Get AI-powered outfit suggestions based on closet items and natural language query
     
     Args:
         request: JSON request containing query string
+        user_id: Closet owner from the X-User-Id header
         
     Returns:
         JSON response with AI-generated outfit suggestions from closet items
@@ -527,11 +832,11 @@ async def get_outfit_suggestions_endpoint(request: OutfitSuggestionsRequest):
         if not query or not query.strip():
             raise HTTPException(status_code=400, detail="Query parameter is required and cannot be empty")
         
-        # Call the MongoDB + LLM function
-        result = get_outfit_suggestions_with_llm(query.strip())
+        # Closet from MongoDB, answer from the outfit cache or Gemini
+        result = await get_outfit_suggestions_with_llm_async(query.strip(), user_id)
         
         if result["success"]:
-            return JSONResponse(content={
+            return FastJSONResponse(content={
                 "success": True,
                 "query": result["query"],
                 "total_closet_items": result["total_closet_items"],
@@ -574,13 +879,34 @@ async def root():
 async def health_check():
     """
     Detailed health check endpoint
+
+    Responds 503 while MongoDB is unreachable so load balancers hold traffic
+    until the instance is ready.
     """
-    return {
-        "status": "healthy",
-        "service": "Fashion Fitter API",
-        "version": "1.0.0"
-    }
+    mongodb = await current_readiness()
+    return FastJSONResponse(
+        content={
+            "status": "healthy" if mongodb["ready"] else "unavailable",
+            "service": "Fashion Fitter API",
+            "version": "1.0.0",
+            "mongodb": mongodb,
+            "search_cache": product_search_cache.stats(),
+            "semantic_index": semantic_index.stats()
+        },
+        status_code=200 if mongodb["ready"] else 503
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics: request and stage latency histograms, in-flight
+    gauges, error counters and cache hit ratios
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,232 @@
+"""
+Typo correction for search queries with a symmetric-delete dictionary
+
+Every dictionary word is stored under each string obtained by deleting up to
+``max_edit_distance`` characters from its prefix (SymSpell). A misspelled
+token generates its own deletes, and any shared key yields a candidate, so a
+lookup costs a few dozen dict probes plus an edit distance check on the
+candidates, with no scan of the vocabulary and no database round trip.
+
+The dictionary starts with the query parser's keyword tables; catalog title
+words are added once at startup. Until they are, the shared dictionary knows
+too few real words to tell a typo from an unlisted word, so queries are only
+normalized, not corrected.
+"""
+import threading
+
+from query_parser import (
+    _KEYWORD_TABLE, _TOKEN_PATTERN, STOP_WORDS, PRICE_KEYWORDS,
+)
+
+# Keyword words outrank catalog words of the same distance
+KEYWORD_COUNT = 1_000_000
+MIN_WORD_LENGTH = 3
+# Tokens up to this long are corrected at distance 1 only; at distance 2 they resemble too many words
+SHORT_WORD_LENGTH = 5
+MAX_CACHED_CORRECTIONS = 10_000
+
+
+def edit_distance(source, target, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions)
+
+    Args:
+        source (str): First word
+        target (str): Second word
+        max_distance (int): Stop early once the distance must exceed this
+
+    Returns:
+        int: The distance, or max_distance + 1 if it exceeds max_distance
+    """
+    # Strip the shared prefix and suffix; only the differing middle needs the table
+    start = 0
+    while start < len(source) and start < len(target) and source[start] == target[start]:
+        start += 1
+    source_end, target_end = len(source), len(target)
+    while source_end > start and target_end > start and source[source_end - 1] == target[target_end - 1]:
+        source_end -= 1
+        target_end -= 1
+    source, target = source[start:source_end], target[start:target_end]
+
+    too_far = max_distance + 1
+    if abs(len(source) - len(target)) > max_distance:
+        return too_far
+    if not source or not target:
+        return len(source) or len(target)
+
+    # Cells further than max_distance from the diagonal can never be within bounds
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        source_char = source[i - 1]
+        current = [too_far] * (len(target) + 1)
+        current[0] = i
+        row_minimum = too_far
+        for j in range(max(1, i - max_distance), min(len(target), i + max_distance) + 1):
+            target_char = target[j - 1]
+            value = previous[j - 1] if source_char == target_char else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (i > 1 and j > 1 and source_char == target[j - 2] and source[i - 2] == target_char
+                    and previous_previous[j - 2] + 1 < value):
+                value = previous_previous[j - 2] + 1
+            current[j] = value
+            if value < row_minimum:
+                row_minimum = value
+        if row_minimum > max_distance:
+            return too_far
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else too_far
+
+
+def _deletes(word, max_distance):
+    # All strings reachable from word by deleting up to max_distance characters
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        results |= frontier
+    return results
+
+
+class SpellingCorrector:
+    """
+    Symmetric-delete spelling dictionary
+
+    Tokens of up to SHORT_WORD_LENGTH letters are corrected at distance 1, longer tokens
+    at up to ``max_edit_distance``. Corrections are memoized per token. While
+    ``ready`` is False, correct() only normalizes the text.
+    """
+
+    def __init__(self, max_edit_distance=2, prefix_length=7, ready=True):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.ready = ready
+        self._words = {}
+        self._deletes = {}
+        self._corrections = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, word):
+        return word in self._words
+
+    def __len__(self):
+        return len(self._words)
+
+    def add_words(self, words, count=1):
+        """
+        Add words to the dictionary
+
+        Args:
+            words (iterable or dict): Words, or word -> frequency mapping
+            count (int): Frequency for words given without one
+
+        Raises:
+            TypeError: If a frequency is not an integer (nothing is added)
+        """
+        items = list(words.items()) if isinstance(words, dict) else [(word, count) for word in words]
+        for word, frequency in items:
+            if not isinstance(frequency, int) or isinstance(frequency, bool):
+                raise TypeError(f"Frequency of '{word}' must be an integer, got {type(frequency).__name__}")
+        with self._lock:
+            for word, frequency in items:
+                if len(word) < MIN_WORD_LENGTH or not word.isalpha():
+                    continue
+                if word in self._words:
+                    self._words[word] = max(self._words[word], frequency)
+                    continue
+                self._words[word] = frequency
+                for deleted in _deletes(word[:self.prefix_length], self.max_edit_distance):
+                    self._deletes.setdefault(deleted, []).append(word)
+            # New words can change earlier answers
+            self._corrections = {}
+
+    def lookup(self, token):
+        """
+        Find the closest dictionary word to a token
+
+        Args:
+            token (str): Lowercase word
+
+        Returns:
+            str: The token itself if known or uncorrectable, else the closest
+                word (smallest distance, then highest frequency)
+        """
+        if token in self._words or len(token) < MIN_WORD_LENGTH or not token.isalpha():
+            return token
+        corrections = self._corrections
+        correction = corrections.get(token)
+        if correction is not None:
+            return correction
+
+        max_distance = 1 if len(token) <= SHORT_WORD_LENGTH else self.max_edit_distance
+        best = token
+        best_rank = (max_distance + 1, 0)
+        seen = set()
+        prefix_length = self.prefix_length
+        for deleted in _deletes(token[:prefix_length], max_distance):
+            for word in self._deletes.get(deleted, ()):
+                # Reaching the key took more deletions from the word than the
+                # bound allows; the word may still be reached through another key
+                if len(word[:prefix_length]) - len(deleted) > max_distance:
+                    continue
+                if word in seen:
+                    continue
+                seen.add(word)
+                # Short delete keys are shared by many words; most differ too much in length
+                if abs(len(word) - len(token)) > max_distance:
+                    continue
+                distance = edit_distance(token, word, max_distance)
+                rank = (distance, -self._words[word])
+                if distance <= max_distance and rank < best_rank:
+                    best, best_rank = word, rank
+
+        if len(corrections) >= MAX_CACHED_CORRECTIONS:
+            corrections.clear()
+        corrections[token] = best
+        return best
+
+    def correct(self, text):
+        """
+        Correct every misspelled word of a query
+
+        Args:
+            text (str): Raw query text
+
+        Returns:
+            str: Normalized query (lowercase words separated by single spaces)
+                with unknown words replaced by their closest dictionary word
+                (left as they are while the dictionary is not ready)
+        """
+        tokens = _TOKEN_PATTERN.findall((text or '').lower())
+        if not self.ready:
+            return ' '.join(tokens)
+        return ' '.join(self.lookup(token) for token in tokens)
+
+
+def _keyword_words():
+    words = set(STOP_WORDS) | {'size'}
+    for phrase in list(_KEYWORD_TABLE) + list(PRICE_KEYWORDS):
+        words.update(phrase.replace('-', ' ').split())
+    return words
+
+
+# Process-wide dictionary used by the search endpoints; the server marks it
+# ready once the catalog title words are loaded
+spelling_corrector = SpellingCorrector(ready=False)
+spelling_corrector.add_words(_keyword_words(), count=KEYWORD_COUNT)
+
+
+def correct_query(text):
+    """
+    Correct a search query with the shared dictionary
+
+    Args:
+        text (str): Raw query text
+
+    Returns:
+        str: Corrected, normalized query text
+    """
+    return spelling_corrector.correct(text)
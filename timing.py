@@ -0,0 +1,164 @@
+"""
+Per-request stage timing
+
+Code marks the stages of a request with ``with span("gemini"): ...``.
+ServerTimingMiddleware collects the spans of each HTTP request, returns them
+in a ``Server-Timing`` response header (shown per request in browser
+devtools) and writes one JSON log line per request:
+
+    {"method": "POST", "path": "/generate-photo-and-data", "status": 200,
+     "total_ms": 20412.7, "spans": {"browser-launch": 2210.4, "page-load": 3518.2, ...}}
+
+Spans recorded in threadpool calls (run_in_threadpool) belong to the request
+that issued them. Every span also feeds the stage metrics in metrics.py, in or
+out of a request. With REQUEST_TIMING_ENABLED and METRICS_ENABLED both false,
+span() returns a shared no-op, so instrumented code costs one context
+variable lookup.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+
+from metrics import METRICS_ENABLED, stage_duration_seconds, stage_errors_total, stage_in_flight
+
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+_current_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Spans of one request; repeated names accumulate their durations"""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # name -> [total milliseconds, count], in first-seen order
+        self.spans = {}
+
+    def add(self, name, duration_ms):
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [duration_ms, 1]
+        else:
+            entry[0] += duration_ms
+            entry[1] += 1
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self):
+        """
+        Server-Timing header value
+
+        Returns:
+            str: e.g. 'spelling;dur=0.1, mongo-search;dur=12.4;desc="2x", total;dur=13.0'
+        """
+        parts = []
+        for name, (duration_ms, count) in self.spans.items():
+            part = f"{name};dur={duration_ms:.1f}"
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+
+class _Span:
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name, timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            stage_in_flight.inc(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        if self.timings is not None:
+            self.timings.add(self.name, duration * 1000)
+        if METRICS_ENABLED:
+            stage_in_flight.dec(self.name)
+            stage_duration_seconds.observe(duration, self.name)
+            if exc_type is not None:
+                stage_errors_total.inc(self.name)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """
+    Time a stage of the current request and record it in the stage metrics
+
+    Args:
+        name (str): Stage name; a Server-Timing token (letters, digits, "-", "_")
+
+    Returns:
+        Context manager recording the stage's duration on exit (also on error)
+    """
+    timings = _current_timings.get()
+    if timings is None and not METRICS_ENABLED:
+        return _NO_SPAN
+    return _Span(name, timings)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware collecting span() timings per HTTP request
+
+    Adds the Server-Timing header to the response and logs the request's
+    spans as one JSON line on the "timing" logger once the response is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            logger.info(json.dumps({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "total_ms": round(timings.elapsed_ms(), 1),
+                "spans": {name: round(duration_ms, 1) for name, (duration_ms, _) in timings.spans.items()},
+            }))